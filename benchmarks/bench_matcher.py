@@ -0,0 +1,172 @@
+"""Offline accuracy and latency benchmark for the Spotify to YouTube matcher.
+
+The fixtures hold YouTube search results recorded for a set of Spotify
+tracks, the time each search took and a human label of the right video.
+Scoring replays the searches through ``Music.match_spotify_track`` with
+the recorded latency, so the per-track time covers search and scoring.
+
+Usage:
+    python benchmarks/bench_matcher.py            # score the recorded fixtures
+    python benchmarks/bench_matcher.py --record   # refresh the search results (needs network), clears labels
+    python benchmarks/bench_matcher.py --label    # label the right video of each unlabelled case
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import types
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cogs.music as music
+from cogs.music import MATCH_CANDIDATES, MATCH_MIN_SCORE, SpotifyMatcher
+
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures', 'spotify_search.json')
+
+def search_url(track):
+    return f"ytsearch{MATCH_CANDIDATES}:{SpotifyMatcher(cache_file=None).search_query(track)}"
+
+def save(fixtures):
+    with open(FIXTURES, 'w', encoding='utf-8') as f:
+        json.dump(fixtures, f, ensure_ascii=False, indent=2)
+
+def record(fixtures):
+    """Replace the search results with fresh ones from YouTube and clear their labels."""
+    import yt_dlp
+
+    with yt_dlp.YoutubeDL({'quiet': True, 'extract_flat': True}) as ydl:
+        for case in fixtures['cases']:
+            start = time.perf_counter()
+            info = ydl.extract_info(search_url(case['track']), download=False)
+            case['search_seconds'] = round(time.perf_counter() - start, 3)
+            case['entries'] = [
+                {key: entry.get(key) for key in ('id', 'url', 'title', 'duration', 'channel')}
+                for entry in info.get('entries') or []
+            ]
+            # Labels refer to the old results
+            case['expected'] = None
+            print(f"Recorded {len(case['entries'])} results for {case['track']['name']} in {case['search_seconds']}s")
+
+    fixtures['source'] = 'recorded'
+    fixtures['recorded_at'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    save(fixtures)
+    print('Run with --label to label the new results before scoring.')
+
+def label(fixtures):
+    """Ask which result is the right recording for every unlabelled case."""
+    for case in fixtures['cases']:
+        if case.get('expected'):
+            continue
+        track = case['track']
+        print(f"\n{', '.join(artist['name'] for artist in track['artists'])} - {track['name']}"
+              f" [{track.get('duration_ms', 0) // 1000}s]")
+        for i, entry in enumerate(case['entries'], 1):
+            print(f"  {i}. {entry['title']} | {entry.get('channel')} [{entry.get('duration')}s]")
+        answer = input('Right video (number, empty to skip): ').strip()
+        if answer.isdigit() and 1 <= int(answer) <= len(case['entries']):
+            case['expected'] = case['entries'][int(answer) - 1]['id']
+            save(fixtures)
+
+class ReplayYoutubeDL:
+    """Answers the recorded searches after their recorded latency."""
+
+    searches = {}
+
+    def __init__(self, opts=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, url, download=False, **kwargs):
+        entries, seconds = self.searches[url]
+        time.sleep(seconds)
+        return {'entries': entries}
+
+async def match_all(cases):
+    """Run every case through Music.match_spotify_track, returning the songs and per-track times."""
+    music.yt_dlp = types.SimpleNamespace(YoutubeDL=ReplayYoutubeDL)
+    ReplayYoutubeDL.searches = {
+        search_url(case['track']): (case['entries'], case.get('search_seconds') or 0)
+        for case in cases
+    }
+    cog = music.Music(types.SimpleNamespace(loop=asyncio.get_running_loop()))
+    cog.matcher = SpotifyMatcher(cache_file=None)
+    cog.get_ydl_opts = lambda: dict(cog.ydl_opts)
+
+    results = []
+    for case in cases:
+        start = time.perf_counter()
+        song = await cog.match_spotify_track(case['track'])
+        results.append((song, (time.perf_counter() - start) * 1000))
+    return results
+
+def p95(values):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * 0.95))]
+
+def run(fixtures):
+    cases = fixtures['cases']
+    if fixtures.get('source') != 'recorded':
+        print('⚠️ These fixtures are synthetic, not recorded search results. The numbers are only a smoke test;')
+        print('   run --record and --label to benchmark against real YouTube results.\n')
+
+    matcher = SpotifyMatcher(cache_file=None)
+    score_times = []
+    cacheable = 0
+    for case in cases:
+        start = time.perf_counter()
+        _, score = matcher.best_match(case['track'], case['entries'])
+        score_times.append((time.perf_counter() - start) * 1000)
+        cacheable += score >= MATCH_MIN_SCORE
+
+    results = asyncio.run(match_all(cases))
+    track_times = [elapsed for _, elapsed in results]
+
+    labelled = [(case, song) for case, (song, _) in zip(cases, results) if case.get('expected')]
+    correct = first_correct = 0
+    for case, song in labelled:
+        urls = {entry['id']: entry['url'] for entry in case['entries']}
+        chosen_ok = song['url'] == urls.get(case['expected'])
+        correct += chosen_ok
+        first_correct += case['entries'][0]['id'] == case['expected']
+        if not chosen_ok:
+            print(f"✗ {case['track']['name']}: picked {song['url']}")
+
+    recorded = sum(1 for case in cases if case.get('search_seconds') is not None)
+    print(f'Cases:              {len(cases)} ({len(labelled)} labelled, {recorded} with recorded latency)')
+    if labelled:
+        print(f'Accuracy (scored):  {correct / len(labelled):.0%}')
+        print(f'Accuracy (first):   {first_correct / len(labelled):.0%}')
+    else:
+        print('Accuracy:           no labelled cases, run --label')
+    print(f'Cacheable matches:  {cacheable / len(cases):.0%}')
+    print(f'Per-track mean/p95: {statistics.mean(track_times):.1f}/{p95(track_times):.1f} ms (search + score)')
+    print(f'Scoring mean/p95:   {statistics.mean(score_times):.3f}/{p95(score_times):.3f} ms')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--record', action='store_true', help='refresh fixtures from YouTube, clearing labels')
+    parser.add_argument('--label', action='store_true', help='label the right video of unlabelled cases')
+    args = parser.parse_args()
+
+    with open(FIXTURES, 'r', encoding='utf-8') as f:
+        fixtures = json.load(f)
+
+    if args.record:
+        record(fixtures)
+        return
+    if args.label:
+        label(fixtures)
+    run(fixtures)
+
+if __name__ == '__main__':
+    main()
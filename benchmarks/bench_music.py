@@ -0,0 +1,445 @@
+"""Offline load simulation for the Music cog.
+
+Drives the cog with fake guilds, voice clients and contexts while yt-dlp,
+Spotify and FFmpeg are replaced by stubs fed from the recorded fixtures, so
+it runs without network access or an FFmpeg binary.
+
+Usage:
+    python benchmarks/bench_music.py --guilds 50
+    python benchmarks/bench_music.py --guilds 50 --json bench_output.txt
+    python benchmarks/bench_music.py --guilds 50 --compare bench_output.txt
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from discord.ext import commands
+
+import cogs.music as music
+
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+FRAME_SIZE = 3840  # 20ms of 48kHz stereo s16 PCM
+OPUS_FRAME_SIZE = 320  # 20ms of Opus at 128kbps
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+class Stats:
+    """Counters shared by the stubs and the simulation."""
+
+    def __init__(self):
+        self.extractions = 0
+        self.ffmpeg_spawned = 0
+        self.first_audio = {}  # guild id -> time of the first PCM frame
+        self.command_times = {}  # command name -> durations
+        self.lock = threading.Lock()
+
+    def record_command(self, name, seconds):
+        self.command_times.setdefault(name, []).append(seconds)
+
+STATS = Stats()
+
+# Stubs
+
+class FakeYoutubeDL:
+    """Answers extract_info from the fixtures after a recorded-like delay."""
+
+    sim = load_fixture('music_sim.json')
+    searches = {
+        f"ytsearch{music.MATCH_CANDIDATES}:{music.SpotifyMatcher(cache_file=None).search_query(case['track'])}": case['entries']
+        for case in load_fixture('spotify_search.json')['cases']
+    }
+    videos = {video['id']: video for video in sim['videos']}
+    signatures = itertools.count()
+
+    def __init__(self, opts=None):
+        self.opts = opts or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def _video(self, video_id, title=None, duration=None):
+        video = self.videos.get(video_id, {})
+        return {
+            'id': video_id,
+            'title': title or video.get('title') or f'Video {video_id}',
+            # Signed stream URLs differ on every extraction
+            'url': f'https://stream.invalid/{video_id}.webm?expire={next(self.signatures)}',
+            'webpage_url': f'https://www.youtube.com/watch?v={video_id}',
+            'duration': duration or video.get('duration', 200),
+            'thumbnail': '',
+        }
+
+    def extract_info(self, url, download=False, **kwargs):
+        latency = self.sim['latency']
+        with STATS.lock:
+            STATS.extractions += 1
+
+        if url.startswith('ytsearch'):
+            time.sleep(latency['search'])
+            count, _, query = url[len('ytsearch'):].partition(':')
+            entries = self.searches.get(url) or [
+                {'id': f'yt-s{abs(hash((query, i))) % 10 ** 8}', 'title': f'{query} #{i}',
+                 'url': f'https://www.youtube.com/watch?v=yt-s{i}', 'duration': 200, 'channel': 'Sim'}
+                for i in range(int(count or 1))
+            ]
+            return {'entries': entries}
+
+        if 'list=' in url:
+            time.sleep(latency['playlist'])
+            playlist = self.sim['playlist']
+            return {
+                'title': playlist['title'],
+                'entries': [
+                    {'id': entry['id'], 'title': entry['title'], 'duration': entry['duration'],
+                     'url': f'https://www.youtube.com/watch?v={entry["id"]}' if entry['title'] else None}
+                    for entry in playlist['entries']
+                ],
+            }
+
+        if not url.startswith('http'):
+            raise Exception(f"'{url}' is not a valid URL")
+
+        time.sleep(latency['video'])
+        if url.startswith('https://stream.invalid/'):
+            video_id = url.split('/')[-1].split('.')[0]
+        else:
+            video_id = url.rsplit('=', 1)[-1].rsplit('/', 1)[-1].split('.')[0]
+        return self._video(video_id)
+
+class FakeSpotify:
+    """Serves the tracks of the matcher fixtures."""
+
+    def __init__(self):
+        self.tracks = [case['track'] for case in load_fixture('spotify_search.json')['cases']]
+
+    async def track(self, track_id, priority=None):
+        await asyncio.sleep(0.05)
+        return next((track for track in self.tracks if track['id'] == track_id), self.tracks[0])
+
+    async def playlist_tracks(self, playlist_id, priority=None):
+        await asyncio.sleep(0.1)
+        return [dict(track) for track in self.tracks]
+
+    album_tracks = playlist_tracks
+
+    async def close(self):
+        pass
+
+class FakeFFmpeg:
+    """Stands in for the supervised FFmpeg sources, producing silence of a fixed length."""
+
+    track_seconds = 2.0
+
+    def __init__(self, source, *, supervisor, guild_id, **kwargs):
+        self.supervisor = supervisor
+        self.guild_id = guild_id
+        self.pid = 0
+        with STATS.lock:
+            STATS.ffmpeg_spawned += 1
+        self.started_at = self.last_read = time.monotonic()
+        self.stats = {}
+        self.returncode = None
+        self.stderr_log = io.BytesIO()
+        self.frames_left = int(self.track_seconds / music.FRAME_SECONDS)
+        self.cleaned = False
+        # Shared streams are spawned with an Opus bitrate
+        self.opus = 'bitrate' in kwargs
+        self.frame = bytes(OPUS_FRAME_SIZE if self.opus else FRAME_SIZE)
+
+    def is_running(self):
+        return not self.cleaned
+
+    def stderr_tail(self, limit=2048):
+        return ''
+
+    def read(self):
+        self.last_read = time.monotonic()
+        if self.frames_left <= 0:
+            return b''
+        self.frames_left -= 1
+        return self.frame
+
+    def is_opus(self):
+        return self.opus
+
+    def cleanup(self):
+        if not self.cleaned:
+            self.cleaned = True
+            self.returncode = 0
+            self.supervisor.unregister(self)
+
+# Fake Discord objects
+
+class FakeVoiceClient:
+    """Plays a source on a thread at real-time pace, like discord.py's AudioPlayer."""
+
+    def __init__(self, guild, speed):
+        self.guild = guild
+        self.speed = speed
+        self.source = None
+        self._playing = threading.Event()
+        self._paused = False
+        self._stop = threading.Event()
+
+    def play(self, source, *, after=None):
+        if self.is_playing():
+            raise music.discord.ClientException('Already playing audio.')
+        self.source = source
+        self._stop = threading.Event()
+        self._playing.set()
+        threading.Thread(target=self._run, args=(source, after, self._stop), daemon=True).start()
+
+    def _run(self, source, after, stop):
+        delay = music.FRAME_SECONDS / self.speed
+        while not stop.is_set():
+            if self._paused:
+                time.sleep(delay)
+                continue
+            if not source.read():
+                break
+            STATS.first_audio.setdefault(self.guild.id, time.perf_counter())
+            time.sleep(delay)
+        self._playing.clear()
+        if after:
+            after(None)
+        source.cleanup()
+
+    def is_playing(self):
+        return self._playing.is_set() and not self._paused
+
+    def is_paused(self):
+        return self._paused
+
+    def pause(self):
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    def stop(self):
+        self._stop.set()
+
+    async def disconnect(self):
+        self.stop()
+        self.guild.voice_client = None
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.voice_client = None
+
+class FakeChannel:
+    def __init__(self, guild, speed):
+        self.guild = guild
+        self.speed = speed
+
+    async def connect(self):
+        self.guild.voice_client = FakeVoiceClient(self.guild, self.speed)
+        return self.guild.voice_client
+
+class FakeContext:
+    def __init__(self, guild, speed):
+        self.guild = guild
+        self.author = types.SimpleNamespace(voice=types.SimpleNamespace(channel=FakeChannel(guild, speed)))
+        self.sent = 0
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    async def send(self, content=None, *, embed=None):
+        self.sent += 1
+
+class FakeBot:
+    def __init__(self, loop):
+        self.loop = loop
+        self.guilds = {}
+
+    def get_guild(self, guild_id):
+        return self.guilds.get(guild_id)
+
+# Simulation
+
+async def run_command(cog, name, ctx, **kwargs):
+    command = getattr(type(cog), name)
+    callback = command.callback if isinstance(command, commands.Command) else command
+    start = time.perf_counter()
+    await callback(cog, ctx, **kwargs)
+    STATS.record_command(name, time.perf_counter() - start)
+
+async def guild_script(cog, ctx, rng, sim):
+    """A mix of searches, direct links, playlists and skips."""
+    videos = sim['videos']
+    await run_command(cog, 'play', ctx, query=rng.choice(sim['queries']))
+    await asyncio.sleep(rng.uniform(0, 0.5))
+    await run_command(cog, 'play', ctx, query=f"https://www.youtube.com/watch?v={rng.choice(videos)['id']}")
+    if rng.random() < 0.5:
+        await run_command(cog, 'play', ctx, query=f"https://www.youtube.com/playlist?list={sim['playlist']['id']}")
+    else:
+        await run_command(cog, 'play', ctx, query='https://open.spotify.com/playlist/simPlaylist01')
+    for _ in range(2):
+        await asyncio.sleep(rng.uniform(0.2, 1.0))
+        if ctx.voice_client and ctx.voice_client.is_playing():
+            await run_command(cog, 'skip', ctx)
+
+async def measure_loop_lag(samples, stop, interval=0.05):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - start - interval))
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def simulate(args):
+    sim = load_fixture('music_sim.json')
+    music.yt_dlp = types.SimpleNamespace(YoutubeDL=FakeYoutubeDL)
+    music.SupervisedFFmpegPCMAudio = FakeFFmpeg
+    music.SupervisedFFmpegOpusAudio = FakeFFmpeg
+    FakeFFmpeg.track_seconds = args.track_seconds
+    if args.no_rate_limit:
+        music.RATE_LIMITS = {service: (10_000, 10_000) for service in music.RATE_LIMITS}
+
+    bot = FakeBot(asyncio.get_running_loop())
+    cog = music.Music(bot)
+    cog.scheduler = music.RequestScheduler(music.RATE_LIMITS)
+    cog.spotify = FakeSpotify()
+    cog.matcher = music.SpotifyMatcher(cache_file=None)
+    cog.get_ydl_opts = lambda: dict(cog.ydl_opts)
+
+    lag_samples = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(lag_samples, stop))
+
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+
+    rng = random.Random(args.seed)
+    contexts = []
+    started = {}
+    for guild_id in range(1, args.guilds + 1):
+        guild = FakeGuild(guild_id)
+        bot.guilds[guild_id] = guild
+        contexts.append(FakeContext(guild, args.speed))
+
+    async def start_guild(ctx):
+        started[ctx.guild.id] = time.perf_counter()
+        await guild_script(cog, ctx, random.Random(rng.random()), sim)
+
+    await asyncio.gather(*(start_guild(ctx) for ctx in contexts))
+    memory_peak = tracemalloc.get_traced_memory()[1]
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    extractions = STATS.extractions
+
+    # Drain playback so player threads exit before shutting down
+    for ctx in contexts:
+        await run_command(cog, 'stop', ctx)
+    await asyncio.sleep(0.5)
+    stop.set()
+    await lag_task
+    tracemalloc.stop()
+
+    ttfa = [STATS.first_audio[guild_id] - started[guild_id] for guild_id in started if guild_id in STATS.first_audio]
+    return {
+        'guilds': args.guilds,
+        'wall_seconds': wall,
+        'loop_lag_ms': {
+            'mean': statistics.mean(lag_samples) * 1000 if lag_samples else 0.0,
+            'p99': percentile(lag_samples, 0.99) * 1000,
+            'max': max(lag_samples, default=0.0) * 1000,
+        },
+        'time_to_first_audio_s': {
+            'p50': percentile(ttfa, 0.5),
+            'p95': percentile(ttfa, 0.95),
+            'missing': args.guilds - len(ttfa),
+        },
+        'extractions_per_second': extractions / wall,
+        'ffmpeg_spawned': STATS.ffmpeg_spawned,
+        'memory_per_guild_kb': (memory_peak - memory_before) / args.guilds / 1024,
+        'cpu_percent': cpu / wall * 100,
+        'commands_p95_s': {name: percentile(times, 0.95) for name, times in STATS.command_times.items()},
+    }
+
+def print_report(result):
+    print(f"Guilds:               {result['guilds']} ({result['wall_seconds']:.1f}s)")
+    lag = result['loop_lag_ms']
+    print(f"Event loop lag:       mean {lag['mean']:.1f}ms, p99 {lag['p99']:.1f}ms, max {lag['max']:.1f}ms")
+    ttfa = result['time_to_first_audio_s']
+    print(f"Time to first audio:  p50 {ttfa['p50']:.2f}s, p95 {ttfa['p95']:.2f}s ({ttfa['missing']} never played)")
+    print(f"Extraction rate:      {result['extractions_per_second']:.1f}/s")
+    print(f"FFmpeg processes:     {result['ffmpeg_spawned']}")
+    print(f"Memory per guild:     {result['memory_per_guild_kb']:.1f} KB")
+    print(f"CPU:                  {result['cpu_percent']:.1f}%")
+    for name, seconds in sorted(result['commands_p95_s'].items()):
+        print(f"  {name:<8} p95       {seconds:.2f}s")
+
+# Metrics where higher is worse, compared against a saved run
+REGRESSION_KEYS = (
+    ('loop_lag_ms', 'p99'),
+    ('time_to_first_audio_s', 'p95'),
+    ('memory_per_guild_kb', None),
+    ('cpu_percent', None),
+)
+
+def compare(result, baseline, tolerance):
+    regressions = []
+    for key, sub in REGRESSION_KEYS:
+        new = result[key][sub] if sub else result[key]
+        old = baseline[key][sub] if sub else baseline[key]
+        if old and new > old * (1 + tolerance):
+            regressions.append(f"{key}{'.' + sub if sub else ''}: {old:.2f} -> {new:.2f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--guilds', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--speed', type=float, default=10.0, help='playback speed-up of the fake voice clients')
+    parser.add_argument('--track-seconds', type=float, default=20.0, help='audio length of each fake track')
+    parser.add_argument('--no-rate-limit', action='store_true', help='lift the upstream rate limits')
+    parser.add_argument('--json', metavar='PATH', help='write the results to PATH')
+    parser.add_argument('--compare', metavar='PATH', help='fail if worse than the results in PATH')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed regression ratio for --compare')
+    args = parser.parse_args()
+
+    result = asyncio.run(simulate(args))
+    print_report(result)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Offline check of SpotifyClient against a local mock of the Spotify Web API.
+
+Covers concurrent pagination, skipping unplayable playlist items, the token refresh on 401 and backing off on
+429/Retry-After from both the API and the token endpoint.
+
+Usage:
+    python benchmarks/check_spotify_client.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from aiohttp import web
+
+from cogs.music import RequestScheduler, SpotifyClient
+
+PLAYLIST_TOTAL = 250
+PLAYLIST_LOCAL = 'p3'  # Local file, Spotify can't play it
+PLAYLIST_EPISODE = 'p7'  # Podcast episode, no artists
+ALBUM_TOTAL = 120
+RETRY_AFTER = 1
+
+class MockSpotify:
+    """Spotify Web API stand-in that misbehaves once per endpoint."""
+
+    def __init__(self):
+        self.token_requests = 0
+        self.tokens = set()
+        self.requests = []
+        self.failed = set()
+
+    def fail_once(self, name: str) -> bool:
+        if name in self.failed:
+            return False
+        self.failed.add(name)
+        return True
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/token', self.token)
+        app.router.add_get('/v1/tracks/{id}', self.track)
+        app.router.add_get('/v1/playlists/{id}/tracks', self.playlist_tracks)
+        app.router.add_get('/v1/albums/{id}', self.album)
+        app.router.add_get('/v1/albums/{id}/tracks', self.album_tracks)
+        return app
+
+    def authorized(self, request) -> bool:
+        return request.headers.get('Authorization', '').removeprefix('Bearer ') in self.tokens
+
+    def rate_limited(self):
+        return web.json_response({'error': 'rate limited'}, status=429, headers={'Retry-After': str(RETRY_AFTER)})
+
+    def page(self, limit: int, offset: int, total: int, prefix: str) -> dict:
+        return {
+            'items': [
+                {'id': f'{prefix}{i}', 'name': f'Track {i}', 'type': 'track'}
+                for i in range(offset, min(offset + limit, total))
+            ],
+            'total': total,
+        }
+
+    async def token(self, request):
+        self.token_requests += 1
+        if self.fail_once('token'):
+            return self.rate_limited()
+        token = f'token-{self.token_requests}'
+        self.tokens.add(token)
+        return web.json_response({'access_token': token, 'expires_in': 3600})
+
+    async def track(self, request):
+        self.requests.append(request.path_qs)
+        if self.fail_once('track'):
+            # Token revoked server side
+            self.tokens.clear()
+        if not self.authorized(request):
+            return web.json_response({'error': 'invalid token'}, status=401)
+        return web.json_response({'id': request.match_info['id'], 'name': 'Track'})
+
+    async def playlist_tracks(self, request):
+        self.requests.append(request.path_qs)
+        if not self.authorized(request):
+            return web.json_response({'error': 'invalid token'}, status=401)
+        page = self.page(int(request.query['limit']), int(request.query['offset']), PLAYLIST_TOTAL, 'p')
+        for item in page['items']:
+            if item['id'] == PLAYLIST_LOCAL:
+                item.update(id=None, is_local=True)
+            elif item['id'] == PLAYLIST_EPISODE:
+                item['type'] = 'episode'
+        page['items'] = [{'track': item} for item in page['items']]
+        return web.json_response(page)
+
+    async def album(self, request):
+        self.requests.append(request.path_qs)
+        if self.fail_once('album'):
+            return self.rate_limited()
+        # The first page of tracks comes embedded in the album
+        first = self.page(50, 0, ALBUM_TOTAL, 'a')
+        return web.json_response({'name': 'Album', 'images': [{'url': 'cover'}], 'tracks': first})
+
+    async def album_tracks(self, request):
+        self.requests.append(request.path_qs)
+        return web.json_response(self.page(int(request.query['limit']), int(request.query['offset']), ALBUM_TOTAL, 'a'))
+
+def check(condition: bool, message: str):
+    print(f"{'✓' if condition else '✗'} {message}")
+    if not condition:
+        raise SystemExit(1)
+
+async def main():
+    mock = MockSpotify()
+    runner = web.AppRunner(mock.app())
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    base = f'http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}'
+
+    client = SpotifyClient(
+        'id', 'secret', scheduler=RequestScheduler(),
+        api_url=f'{base}/v1', token_url=f'{base}/token'
+    )
+    try:
+        start = time.monotonic()
+        track = await client.track('t1')
+        check(track['id'] == 't1', 'track fetched')
+        check(time.monotonic() - start >= RETRY_AFTER, 'token endpoint 429 backed off for Retry-After')
+        check(mock.token_requests == 3, '401 fetched a fresh token once')
+
+        tracks = await client.playlist_tracks('p1')
+        expected = [f'p{i}' for i in range(PLAYLIST_TOTAL) if f'p{i}' not in (PLAYLIST_LOCAL, PLAYLIST_EPISODE)]
+        check([track['id'] for track in tracks] == expected,
+              f'playlist paginated in order ({len(expected)} tracks)')
+        check(len(tracks) == PLAYLIST_TOTAL - 2, 'local file and podcast episode skipped')
+        check(sum('/playlists/' in path for path in mock.requests) == 3, 'one request per page of 100')
+        check(mock.token_requests == 3, 'token reused across requests')
+
+        start = time.monotonic()
+        tracks = await client.album_tracks('a1')
+        check([track['id'] for track in tracks] == [f'a{i}' for i in range(ALBUM_TOTAL)],
+              f'album paginated in order ({ALBUM_TOTAL} tracks)')
+        check(all(track['album']['name'] == 'Album' for track in tracks), 'album attached to its tracks')
+        check(time.monotonic() - start >= RETRY_AFTER, 'API 429 backed off for Retry-After')
+        check(client.scheduler.summary('spotify')['throttled'] == 2, 'both 429s counted as throttled')
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+if __name__ == '__main__':
+    asyncio.run(main())
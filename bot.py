@@ -3,14 +3,130 @@ import discord
 from discord.ext import commands
 from dotenv import load_dotenv
 import logging
+import logging.handlers
 import asyncio
+import contextvars
+import json
+import queue
+import threading
+import time
 from typing import Optional
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_REPEAT_BURST = 5  # identical warnings let through per window before sampling kicks in
+LOG_REPEAT_WINDOW = 60  # seconds
+LOG_REPEAT_KEYS = 1000
+
+# Guild and command of whatever is running, copied into tasks spawned from a command
+log_context = contextvars.ContextVar('log_context', default={})
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """Hand records to the listener thread without formatting them and never block when it falls behind."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Formatting happens on the listener thread; resolving args here would
+        # pay for it on the event loop all over again
+        return record
+
+    def enqueue(self, record):
+        # Report earlier losses on the first record that gets through
+        if self.dropped:
+            record.dropped = self.dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        else:
+            self.dropped = 0
+
+class ContextFilter(logging.Filter):
+    """Fill in guild and command fields from the current log context."""
+
+    def filter(self, record):
+        context = log_context.get()
+        for field in ('guild_id', 'command'):
+            if not hasattr(record, field):
+                setattr(record, field, context.get(field))
+        return True
+
+class RepeatFilter(logging.Filter):
+    """Sample identical warnings and errors: same message and arguments from the same guild."""
+
+    def __init__(self, burst: int = LOG_REPEAT_BURST, window: float = LOG_REPEAT_WINDOW):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.seen = {}
+        # Filters run on whichever thread logged, including voice and executor threads
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+        with self.lock:
+            return self._sample(record)
+
+    def _sample(self, record):
+        # Sharing a budget per template would let one guild's failures hide everyone else's
+        args = record.args if isinstance(record.args, tuple) else (record.args,)
+        key = (
+            record.name, record.levelno, record.msg,
+            getattr(record, 'guild_id', None), tuple(str(arg) for arg in args)
+        )
+        now = time.monotonic()
+        entry = self.seen.get(key)
+        if entry is None or now - entry[0] > self.window:
+            if len(self.seen) >= LOG_REPEAT_KEYS:
+                self.seen.clear()
+            suppressed = entry[2] if entry else 0
+            self.seen[key] = [now, 1, 0]
+        else:
+            entry[1] += 1
+            if entry[1] > self.burst:
+                entry[2] += 1
+                return False
+            suppressed = 0
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the structured fields the bot attaches."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in ('guild_id', 'command', 'latency_ms', 'suppressed', 'dropped'):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def setup_logging(level: int = logging.INFO) -> logging.handlers.QueueListener:
+    """Route all logging through a bounded queue drained by a background thread."""
+    stream = logging.StreamHandler()
+    stream.setFormatter(JsonFormatter())
+
+    handler = LazyQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(ContextFilter())
+    handler.addFilter(RepeatFilter())
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.handlers = [handler]
+    return logging.handlers.QueueListener(handler.queue, stream, respect_handler_level=True)
+
 logger = logging.getLogger(__name__)
 
 # Load environment variables
@@ -30,6 +146,14 @@ class MusicBot(commands.Bot):
         )
         
         self.queues = {}  # Store queues for each guild
+        self.before_invoke(self.set_log_context)
+        
+    async def set_log_context(self, ctx):
+        ctx.started_at = time.perf_counter()
+        log_context.set({
+            'guild_id': ctx.guild.id if ctx.guild else None,
+            'command': ctx.command.qualified_name,
+        })
         
     async def setup_hook(self):
         # Load all cogs
@@ -37,19 +161,19 @@ class MusicBot(commands.Bot):
             if filename.endswith('.py'):
                 try:
                     await self.load_extension(f'cogs.{filename[:-3]}')
-                    logger.info(f'✅ Loaded extension: {filename}')
+                    logger.info('✅ Loaded extension: %s', filename)
                 except Exception as e:
-                    logger.error(f'❌ Failed to load extension {filename}: {e}')
+                    logger.error('❌ Failed to load extension %s: %s', filename, e)
         
         # Sync commands
         try:
             synced = await self.tree.sync()
-            logger.info(f'✅ Synced {len(synced)} command(s)')
+            logger.info('✅ Synced %d command(s)', len(synced))
         except Exception as e:
-            logger.error(f'❌ Failed to sync commands: {e}')
+            logger.error('❌ Failed to sync commands: %s', e)
     
     async def on_ready(self):
-        logger.info(f'🚀 Bot is ready! Logged in as {self.user.name}')
+        logger.info('🚀 Bot is ready! Logged in as %s', self.user.name)
         await self.change_presence(
             activity=discord.Activity(
                 type=discord.ActivityType.watching,
@@ -57,17 +181,30 @@ class MusicBot(commands.Bot):
             )
         )
     
+    def command_log_fields(self, ctx) -> dict:
+        fields = {
+            'guild_id': ctx.guild.id if ctx.guild else None,
+            'command': ctx.command.qualified_name if ctx.command else None,
+        }
+        started_at = getattr(ctx, 'started_at', None)
+        if started_at is not None:
+            fields['latency_ms'] = round((time.perf_counter() - started_at) * 1000, 1)
+        return fields
+    
+    async def on_command_completion(self, ctx):
+        logger.info('Command %s completed', ctx.command.qualified_name, extra=self.command_log_fields(ctx))
+    
     async def on_command_error(self, ctx, error):
         if isinstance(error, commands.CommandNotFound):
             return
         
         error_message = 'Có lỗi xảy ra khi thực hiện lệnh này!'
-        logger.error(f'❌ Error executing command: {error}')
+        logger.error('❌ Error executing command: %s', error, extra=self.command_log_fields(ctx))
         
         try:
             await ctx.send(error_message)
         except discord.HTTPException as e:
-            logger.error(f'❌ Error sending error message: {e}')
+            logger.error('❌ Error sending error message: %s', e)
 
 async def main():
     bot = MusicBot()
@@ -80,9 +217,12 @@ async def main():
             
         await bot.start(token)
     except Exception as e:
-        logger.error(f'❌ Error starting bot: {e}')
+        logger.error('❌ Error starting bot: %s', e)
 
 if __name__ == '__main__':
+    listener = setup_logging()
+    listener.start()
+    
     # Set up asyncio event loop
     loop = asyncio.get_event_loop()
     try:
@@ -90,4 +230,6 @@ if __name__ == '__main__':
     except KeyboardInterrupt:
         logger.info("Bot is shutting down...")
     finally:
-        loop.close() 
\ No newline at end of file
+        loop.close()
+        # Flush whatever is still queued
+        listener.stop() 
\ No newline at end of file
@@ -0,0 +1,210 @@
+import discord
+from discord.ext import commands
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Loop lag that counts as a stall, overridable from the environment
+STALL_THRESHOLD = int(os.getenv('STALL_THRESHOLD_MS', '250')) / 1000
+HEARTBEAT_INTERVAL = 0.1  # seconds between event loop heartbeats
+PROFILE_MAX_SECONDS = 300
+MUSIC_FILE = os.path.join('cogs', 'music.py')
+
+class StallDetector:
+    """Watch the event loop from a thread and dump the loop thread's stack when it stops responding."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, threshold: float = STALL_THRESHOLD):
+        self.loop = loop
+        self.threshold = threshold
+        self.loop_thread_id = threading.get_ident()  # Created on the loop thread
+        self.last_beat = time.monotonic()
+        self.active_commands: Dict[int, dict] = {}
+        self.stalls = deque(maxlen=20)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._heartbeat = self.loop.create_task(self._beat())
+        self._thread = threading.Thread(target=self._watch, name='stall-detector', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._heartbeat:
+            self._heartbeat.cancel()
+
+    async def _beat(self):
+        while True:
+            self.last_beat = time.monotonic()
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    def _watch(self):
+        reported = False
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            lag = time.monotonic() - self.last_beat - HEARTBEAT_INTERVAL
+            if lag > self.threshold and not reported:
+                # Only dump once per stall
+                reported = True
+                self._report(lag)
+            elif lag <= self.threshold:
+                reported = False
+
+    def _report(self, lag: float):
+        frame = sys._current_frames().get(self.loop_thread_id)
+        stack = traceback.extract_stack(frame) if frame else []
+
+        # The innermost frame in our own code is the most likely culprit
+        culprit = next(
+            (f'{os.path.basename(entry.filename)}:{entry.lineno} {entry.name}'
+             for entry in reversed(stack) if os.sep + 'cogs' + os.sep in entry.filename),
+            None
+        )
+        try:
+            task = asyncio.current_task(self.loop)
+        except RuntimeError:
+            task = None
+        coroutine = task.get_coro().__qualname__ if task else None
+
+        stall = {
+            'time': time.time(),
+            'lag': lag,
+            'culprit': culprit,
+            'coroutine': coroutine,
+            'commands': [f"{info['command']} (guild {info['guild_id']})" for info in list(self.active_commands.values())],
+            'stack': ''.join(traceback.format_list(stack[-15:])),
+        }
+        self.stalls.append(stall)
+        logger.warning(
+            "⚠️ Event loop stalled for %.0fms in %s at %s, running commands: %s\n%s",
+            lag * 1000, coroutine or 'unknown coroutine', culprit or 'unknown location',
+            ', '.join(stall['commands']) or 'none', stall['stack']
+        )
+
+class Debug(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.detector: Optional[StallDetector] = None
+        self.profiling = False
+        # Per command wall times, only collected during a profiling window
+        self.command_times: Dict[str, List[float]] = {}
+
+    async def cog_load(self):
+        self.detector = StallDetector(asyncio.get_running_loop())
+        self.detector.start()
+
+    async def cog_unload(self):
+        if self.detector:
+            self.detector.stop()
+
+    @commands.Cog.listener()
+    async def on_command(self, ctx):
+        self.detector.active_commands[id(ctx)] = {
+            'command': ctx.command.qualified_name,
+            'guild_id': ctx.guild.id if ctx.guild else None,
+            'start': time.perf_counter(),
+        }
+
+    @commands.Cog.listener()
+    async def on_command_completion(self, ctx):
+        info = self.detector.active_commands.pop(id(ctx), None)
+        if info and self.profiling:
+            self.command_times.setdefault(info['command'], []).append(time.perf_counter() - info['start'])
+
+    @commands.Cog.listener()
+    async def on_command_error(self, ctx, error):
+        self.detector.active_commands.pop(id(ctx), None)
+
+    def summarize_profile(self, stats: pstats.Stats) -> str:
+        """Aggregate profile stats per command and per Music method."""
+        lines = ['Per command (wall avg / profiled cumulative CPU):']
+        for command in self.bot.walk_commands():
+            code = command.callback.__code__
+            entry = stats.stats.get((code.co_filename, code.co_firstlineno, code.co_name))
+            times = self.command_times.get(command.qualified_name, [])
+            if not entry and not times:
+                continue
+            wall = sum(times) / len(times) if times else 0.0
+            cumulative = entry[3] if entry else 0.0
+            lines.append(f'  {command.qualified_name:<12} x{len(times):<4} {wall * 1000:8.1f}ms {cumulative * 1000:9.1f}ms')
+
+        lines.append('')
+        lines.append('Music methods (calls / own time / cumulative):')
+        music = [
+            (key, entry) for key, entry in stats.stats.items()
+            if key[0].endswith(MUSIC_FILE)
+        ]
+        music.sort(key=lambda item: item[1][3], reverse=True)
+        for (_, lineno, name), (_, calls, own, cumulative, _) in music[:15]:
+            lines.append(f'  {name:<28} {calls:6d} {own * 1000:9.1f}ms {cumulative * 1000:9.1f}ms')
+        return '\n'.join(lines)
+
+    @commands.command(name='profile')
+    @commands.is_owner()
+    async def profile(self, ctx, seconds: int = 30):
+        """Profile the event loop thread for a number of seconds."""
+        if self.profiling:
+            return await ctx.send('❌ Đang profile rồi!')
+        if not 1 <= seconds <= PROFILE_MAX_SECONDS:
+            return await ctx.send(f'❌ Thời gian phải trong khoảng 1-{PROFILE_MAX_SECONDS} giây!')
+
+        await ctx.send(f'⏱️ Đang profile trong {seconds}s...')
+        self.profiling = True
+        self.command_times = {}
+        # cProfile hooks the thread that enables it, which is the event loop thread
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+            self.profiling = False
+
+        stats = pstats.Stats(profiler)
+        summary = self.summarize_profile(stats)
+
+        report = io.StringIO()
+        report.write(summary + '\n\n')
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(50)
+
+        await ctx.send(
+            f'```\n{summary[:1900]}\n```',
+            file=discord.File(io.BytesIO(report.getvalue().encode()), filename='profile.txt')
+        )
+
+    @commands.command(name='stalls')
+    @commands.is_owner()
+    async def stalls(self, ctx):
+        """Show recent event loop stalls."""
+        if not self.detector.stalls:
+            return await ctx.send('✅ Không có stall nào!')
+
+        embed = discord.Embed(
+            title='🐢 Event loop stalls',
+            description=f'Ngưỡng: {self.detector.threshold * 1000:.0f}ms',
+            color=discord.Color.orange()
+        )
+        for stall in list(self.detector.stalls)[-10:]:
+            embed.add_field(
+                name=f'<t:{int(stall["time"])}:T> - {stall["lag"] * 1000:.0f}ms',
+                value=(
+                    f'`{stall["coroutine"] or "?"}` tại `{stall["culprit"] or "?"}`\n'
+                    f'Lệnh: {", ".join(stall["commands"]) or "không có"}'
+                ),
+                inline=False
+            )
+        await ctx.send(embed=embed)
+
+async def setup(bot):
+    await bot.add_cog(Debug(bot))
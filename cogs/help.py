@@ -23,6 +23,8 @@ class Help(commands.Cog):
             ('resume', 'Tiếp tục phát bài hát'),
             ('queue', 'Hiển thị queue hiện tại'),
             ('nowplaying', 'Hiển thị bài hát đang phát'),
+            ('seek <vị trí>', 'Tua đến vị trí trong bài hát (vd: 1:30)'),
+            ('crossfade [giây]', 'Chuyển bài mượt giữa các bài hát'),
             ('leave', 'Rời voice channel')
         ]
         
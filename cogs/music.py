@@ -1,15 +1,21 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 import asyncio
 import logging
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Callable
+from collections import deque
 import yt_dlp
 import os
 import json
 import time
+import tempfile
+import threading
+import audioop
+import heapq
+import itertools
+import functools
 from datetime import datetime, timedelta
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
+import aiohttp
 import re
 
 logger = logging.getLogger(__name__)
@@ -24,12 +30,959 @@ class CookieManager:
             raise FileNotFoundError("cookies.txt file not found. Please create it with valid YouTube cookies.")
         return self.cookies_file
 
+# FFmpeg process limits, overridable from the environment on shared hosts
+FFMPEG_MAX_PROCESSES = int(os.getenv('FFMPEG_MAX_PROCESSES', '8'))
+FFMPEG_STUCK_TIMEOUT = int(os.getenv('FFMPEG_STUCK_TIMEOUT', '30'))  # seconds without a read while playing
+FFMPEG_ORPHAN_GRACE = 10  # seconds a process may live without a voice client using it
+FFMPEG_IDLE_TIMEOUT = int(os.getenv('FFMPEG_IDLE_TIMEOUT', '300'))  # seconds paused or prefetched without a read
+FFMPEG_SLOT_TIMEOUT = int(os.getenv('FFMPEG_SLOT_TIMEOUT', '60'))  # seconds to wait for a free process slot
+
+def read_process_stats(pid: int) -> Optional[dict]:
+    """Read CPU time and RSS of a process from /proc (Linux only)."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # Fields after the command name, starting at field 3 (state)
+            fields = f.read().rsplit(')', 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    utime, stime, rss_pages = int(fields[11]), int(fields[12]), int(fields[21])
+    return {
+        'cpu_seconds': (utime + stime) / os.sysconf('SC_CLK_TCK'),
+        'rss_bytes': rss_pages * os.sysconf('SC_PAGE_SIZE'),
+    }
+
+class FFmpegBusy(Exception):
+    """No FFmpeg slot freed up in time."""
+
+class SupervisedFFmpegMixin:
+    """Report the lifecycle of an FFmpeg audio source to an FFmpegSupervisor."""
+
+    def __init__(self, source: str, *, supervisor: 'FFmpegSupervisor', guild_id: int, **kwargs):
+        self.supervisor = supervisor
+        self.guild_id = guild_id
+        self.started_at = time.monotonic()
+        self.last_read = self.started_at
+        self.stats: dict = {}
+        self.returncode: Optional[int] = None
+        # Append mode so the diagnostics tail can be read while FFmpeg is still writing
+        self.stderr_log = tempfile.TemporaryFile(mode='a+b')
+        super().__init__(source, stderr=self.stderr_log, **kwargs)
+        self.pid: int = self._process.pid
+
+    def is_running(self) -> bool:
+        process = getattr(self, '_process', None)
+        return bool(process) and process.poll() is None
+
+    def stderr_tail(self, limit: int = 2048) -> str:
+        """Return the last bytes FFmpeg wrote to stderr."""
+        try:
+            self.stderr_log.seek(0, os.SEEK_END)
+            self.stderr_log.seek(max(0, self.stderr_log.tell() - limit))
+            return self.stderr_log.read().decode(errors='ignore').strip()
+        except (OSError, ValueError):
+            return ''
+
+    def read(self) -> bytes:
+        self.last_read = time.monotonic()
+        return super().read()
+
+    def cleanup(self):
+        process = getattr(self, '_process', None)
+        if self.is_running():
+            self.supervisor.sample(self)
+        super().cleanup()
+        self.returncode = getattr(process, 'returncode', None)
+        self.supervisor.unregister(self)
+
+class SupervisedFFmpegPCMAudio(SupervisedFFmpegMixin, discord.FFmpegPCMAudio):
+    """FFmpegPCMAudio that reports its lifecycle to an FFmpegSupervisor."""
+
+class SupervisedFFmpegOpusAudio(SupervisedFFmpegMixin, discord.FFmpegOpusAudio):
+    """FFmpegOpusAudio that reports its lifecycle to an FFmpegSupervisor."""
+
+class FFmpegSupervisor:
+    """Track FFmpeg children per guild, cap how many run at once and reap the ones left behind."""
+
+    def __init__(self, max_processes: int = FFMPEG_MAX_PROCESSES,
+                 stuck_timeout: int = FFMPEG_STUCK_TIMEOUT,
+                 orphan_grace: int = FFMPEG_ORPHAN_GRACE,
+                 idle_timeout: int = FFMPEG_IDLE_TIMEOUT,
+                 slot_timeout: int = FFMPEG_SLOT_TIMEOUT):
+        self.max_processes = max_processes
+        self.stuck_timeout = stuck_timeout
+        self.orphan_grace = orphan_grace
+        self.idle_timeout = idle_timeout
+        self.slot_timeout = slot_timeout
+        self.processes: Dict[int, List[SupervisedFFmpegMixin]] = {}
+        self.history = deque(maxlen=50)  # Diagnostics of finished processes
+        self.waiting = 0
+        self._slots = asyncio.Semaphore(max_processes)
+        self._lock = threading.Lock()  # cleanup() runs on the voice player threads
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def active(self) -> List[SupervisedFFmpegMixin]:
+        """Get all running supervised sources."""
+        with self._lock:
+            return [source for sources in self.processes.values() for source in sources]
+
+    def full(self) -> bool:
+        """Whether a new process would have to wait for a slot."""
+        return self._slots.locked()
+
+    async def spawn(self, guild_id: int, url: str, opus: bool = False, **ffmpeg_options) -> SupervisedFFmpegMixin:
+        """Start FFmpeg for a guild, waiting for a free slot if the ceiling is reached.
+        
+        With ``opus`` FFmpeg encodes Opus itself instead of handing PCM to the voice client.
+        Raises FFmpegBusy if no slot frees up within ``slot_timeout``.
+        """
+        self._loop = asyncio.get_running_loop()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.slot_timeout)
+        except asyncio.TimeoutError:
+            raise FFmpegBusy(f'No FFmpeg slot free after {self.slot_timeout}s') from None
+        finally:
+            self.waiting -= 1
+        
+        try:
+            source_class = SupervisedFFmpegOpusAudio if opus else SupervisedFFmpegPCMAudio
+            source = source_class(url, supervisor=self, guild_id=guild_id, **ffmpeg_options)
+        except Exception:
+            self._slots.release()
+            raise
+        
+        with self._lock:
+            self.processes.setdefault(guild_id, []).append(source)
+        return source
+
+    def unregister(self, source: SupervisedFFmpegMixin):
+        """Forget a cleaned up source and give its slot back."""
+        with self._lock:
+            sources = self.processes.get(source.guild_id, [])
+            if source not in sources:
+                return
+            sources.remove(source)
+            if not sources:
+                del self.processes[source.guild_id]
+        
+        self._record(source)
+        try:
+            self._loop.call_soon_threadsafe(self._slots.release)
+        except RuntimeError:
+            pass  # Event loop already closed during shutdown
+
+    def sample(self, source: SupervisedFFmpegMixin):
+        """Refresh the CPU/RSS sample of a source."""
+        stats = read_process_stats(source.pid)
+        if stats:
+            source.stats = stats
+
+    def _record(self, source: SupervisedFFmpegMixin):
+        entry = {
+            'guild_id': source.guild_id,
+            'pid': source.pid,
+            'returncode': source.returncode,
+            'runtime': time.monotonic() - source.started_at,
+            'stderr': source.stderr_tail(),
+            **source.stats,
+        }
+        source.stderr_log.close()
+        self.history.append(entry)
+        
+        # -9 is our own kill on skip/stop
+        if source.returncode not in (0, -9, None):
+            logger.warning(
+                "⚠️ FFmpeg exited with code %s in guild %s: %s",
+                source.returncode, source.guild_id, entry['stderr'],
+                extra={'guild_id': source.guild_id}
+            )
+
+    async def reap(self, state_of: Callable[[SupervisedFFmpegMixin], Optional[str]],
+                   on_reaped: Optional[Callable[[SupervisedFFmpegMixin], None]] = None):
+        """Kill processes that are stuck, idle or that no voice client uses anymore.
+        
+        ``state_of`` returns 'playing', 'paused' or 'prefetched' for a source
+        attached to a voice client and None for a detached one.  Paused and
+        prefetched processes hold a slot without being read, so they are
+        reaped once idle for ``idle_timeout``; ``on_reaped`` lets the owner
+        let go of them.
+        """
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        for source in self.active():
+            self.sample(source)
+            state = state_of(source)
+            if state is None and now - source.started_at > self.orphan_grace:
+                reason = 'orphaned'
+            elif state == 'playing' and now - source.last_read > self.stuck_timeout:
+                reason = 'stuck'
+            elif state in ('paused', 'prefetched') and now - source.last_read > self.idle_timeout:
+                reason = 'idle'
+            else:
+                continue
+            
+            logger.warning(
+                "⚠️ Reaping %s FFmpeg process %s in guild %s", reason, source.pid, source.guild_id,
+                extra={'guild_id': source.guild_id}
+            )
+            await loop.run_in_executor(None, source.cleanup)
+            if on_reaped:
+                on_reaped(source)
+
+    def shutdown(self):
+        """Kill every tracked process."""
+        for source in self.active():
+            source.cleanup()
+
+# Request priorities, lower is served first
+PRIORITY_INTERACTIVE = 0  # A user is waiting on the answer (play, search)
+PRIORITY_BACKGROUND = 1   # Playlist imports and prefetching
+
+# Requests per second and burst size per upstream service, shared by all guilds
+RATE_LIMITS = {
+    'spotify': (10, 20),
+    'youtube': (5, 10),
+    'soundcloud': (5, 10),
+}
+THROTTLE_BACKOFF = 10  # seconds to back off when a 429 carries no Retry-After
+
+class RateLimited(Exception):
+    """An upstream service asked us to slow down."""
+
+    def __init__(self, service: str, retry_after: float):
+        super().__init__(f'{service} rate limited, retry after {retry_after}s')
+        self.service = service
+        self.retry_after = retry_after
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Get how long to back off after an error, or None if it isn't a rate limit."""
+    if isinstance(error, RateLimited):
+        return error.retry_after
+    if 'HTTP Error 429' in str(error):
+        return THROTTLE_BACKOFF
+    return None
+
+class TokenBucket:
+    """Token bucket that can also be blocked until a Retry-After deadline."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self) -> float:
+        """Seconds until a token can be taken."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+class RequestScheduler:
+    """Schedule outbound API calls per service by priority, within each service's rate limit."""
+
+    def __init__(self, limits: Dict[str, tuple] = RATE_LIMITS, max_retries: int = 3):
+        self.max_retries = max_retries
+        self.buckets = {service: TokenBucket(*limit) for service, limit in limits.items()}
+        self.metrics = {
+            service: {'calls': 0, 'throttled': 0, 'total_wait': 0.0, 'max_wait': 0.0, 'waits': deque(maxlen=500)}
+            for service in limits
+        }
+        self._waiters: Dict[str, list] = {service: [] for service in limits}
+        self._dispatchers: Dict[str, asyncio.Task] = {}
+        self._seq = itertools.count()
+
+    def queued(self, service: str) -> int:
+        """Number of callers waiting for a token."""
+        return sum(1 for _, _, future in self._waiters[service] if not future.done())
+
+    async def acquire(self, service: str, priority: int = PRIORITY_INTERACTIVE):
+        """Wait for a token of ``service``."""
+        queued_at = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters[service], (priority, next(self._seq), future))
+        if service not in self._dispatchers:
+            self._dispatchers[service] = asyncio.create_task(self._dispatch(service))
+        await future
+        
+        waited = time.monotonic() - queued_at
+        metrics = self.metrics[service]
+        metrics['calls'] += 1
+        metrics['total_wait'] += waited
+        metrics['max_wait'] = max(metrics['max_wait'], waited)
+        metrics['waits'].append(waited)
+
+    async def _dispatch(self, service: str):
+        bucket = self.buckets[service]
+        waiters = self._waiters[service]
+        try:
+            while waiters:
+                delay = bucket.delay()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                _, _, future = heapq.heappop(waiters)
+                if future.done():
+                    continue  # Caller was cancelled
+                bucket.take()
+                future.set_result(None)
+        finally:
+            del self._dispatchers[service]
+
+    async def call(self, service: str, func: Callable, *args, priority: int = PRIORITY_INTERACTIVE, **kwargs):
+        """Call ``func`` once ``service`` allows it, backing off and retrying on rate limits.
+        
+        Blocking functions are run in the default executor.
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(service, priority)
+            try:
+                if asyncio.iscoroutinefunction(func):
+                    return await func(*args, **kwargs)
+                return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+            except Exception as e:
+                retry_after = get_retry_after(e)
+                if retry_after is None or attempt == self.max_retries:
+                    raise
+                self.metrics[service]['throttled'] += 1
+                self.buckets[service].block(retry_after)
+                logger.warning("⚠️ %s rate limited, retrying in %ss", service, retry_after)
+
+    def summary(self, service: str) -> dict:
+        """Get queue-wait metrics of a service."""
+        metrics = self.metrics[service]
+        waits = sorted(metrics['waits'])
+        return {
+            'calls': metrics['calls'],
+            'throttled': metrics['throttled'],
+            'queued': self.queued(service),
+            'avg_wait': metrics['total_wait'] / metrics['calls'] if metrics['calls'] else 0.0,
+            'p95_wait': waits[int(len(waits) * 0.95)] if waits else 0.0,
+            'max_wait': metrics['max_wait'],
+        }
+
+MATCH_CANDIDATES = 5  # YouTube results fetched per Spotify track
+MATCH_MIN_SCORE = 0.5  # Matches below this are used but not cached
+MATCH_CACHE_FILE = 'spotify_matches.json'
+MATCH_SAVE_INTERVAL = 60  # seconds between writes of new matches
+# Words that mark a different version of a song unless the Spotify title has them too
+VERSION_MARKERS = (
+    'live', 'cover', 'remix', 'karaoke', 'instrumental', 'nightcore', 'sped', 'slowed',
+    'reverb', '8d', 'loop', 'hour', 'hours', 'reaction', 'acoustic', 'tutorial', 'mashup',
+)
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens."""
+    return re.findall(r'\w+', (text or '').casefold())
+
+class SpotifyMatcher:
+    """Pick the YouTube video that best matches a Spotify track and remember the choice.
+    
+    With ``cache_file`` set to None the mappings are only kept in memory.
+    """
+
+    def __init__(self, cache_file: Optional[str] = MATCH_CACHE_FILE):
+        self.cache_file = cache_file
+        self.cache: Dict[str, dict] = self._load()
+        self.dirty = False
+
+    def _load(self) -> Dict[str, dict]:
+        if not self.cache_file:
+            return {}
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error("❌ Error loading Spotify match cache: %s", e)
+            return {}
+
+    def snapshot(self) -> Optional[Dict[str, dict]]:
+        """Copy the cache for writing if it changed since the last snapshot."""
+        if not self.dirty or not self.cache_file:
+            return None
+        self.dirty = False
+        return dict(self.cache)
+
+    def write(self, cache: Dict[str, dict]):
+        """Write a snapshot atomically, safe to call from another thread."""
+        directory = os.path.dirname(os.path.abspath(self.cache_file))
+        try:
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, delete=False) as f:
+                json.dump(cache, f, ensure_ascii=False)
+            os.replace(f.name, self.cache_file)
+        except OSError as e:
+            self.dirty = True
+            logger.error("❌ Error saving Spotify match cache: %s", e)
+
+    def save(self):
+        """Write the cache if it changed, blocking."""
+        cache = self.snapshot()
+        if cache is not None:
+            self.write(cache)
+
+    def get(self, track_id: str) -> Optional[dict]:
+        return self.cache.get(track_id)
+
+    def remember(self, track_id: str, entry: dict, score: float):
+        self.cache[track_id] = {
+            'url': entry['url'],
+            'title': entry.get('title'),
+            'duration': entry.get('duration'),
+            'score': round(score, 3),
+        }
+        self.dirty = True
+
+    def forget(self, track_id: str, url: str):
+        """Drop the mapping of a track to ``url``, e.g. when the video was deleted or blocked."""
+        cached = self.cache.get(track_id)
+        if cached and cached['url'] == url:
+            del self.cache[track_id]
+            self.dirty = True
+
+    def search_query(self, track: dict) -> str:
+        return f"{track['artists'][0]['name']} - {track['name']} audio"
+
+    def score(self, track: dict, entry: dict) -> float:
+        """Score how likely a YouTube search result is the same recording as a Spotify track."""
+        # Duration is the strongest signal: full marks when equal, none past 30s off
+        expected = track.get('duration_ms', 0) / 1000
+        if entry.get('duration') and expected:
+            duration_score = max(0.0, 1 - abs(entry['duration'] - expected) / 30)
+        else:
+            duration_score = 0.3
+        
+        title_tokens = set(tokenize(track['name']))
+        entry_tokens = set(tokenize(entry.get('title')))
+        title_score = len(title_tokens & entry_tokens) / len(title_tokens) if title_tokens else 0.0
+        
+        channel = entry.get('channel') or entry.get('uploader') or ''
+        artist_tokens = set()
+        for artist in track['artists']:
+            artist_tokens.update(tokenize(artist['name']))
+        artist_score = (
+            len(artist_tokens & (entry_tokens | set(tokenize(channel)))) / len(artist_tokens)
+            if artist_tokens else 0.0
+        )
+        
+        # Auto-generated "Artist - Topic" channels and VEVO upload the studio recording
+        channel_score = 1.0 if channel.endswith(' - Topic') or 'vevo' in channel.casefold() else 0.0
+        
+        markers = [marker for marker in VERSION_MARKERS if marker in entry_tokens and marker not in title_tokens]
+        
+        return (
+            0.4 * duration_score
+            + 0.3 * title_score
+            + 0.15 * artist_score
+            + 0.15 * channel_score
+            - 0.3 * len(markers)
+        )
+
+    def best_match(self, track: dict, entries: List[dict]) -> Optional[tuple]:
+        """Get the best scoring entry and its score."""
+        scored = [(self.score(track, entry), entry) for entry in entries if entry and entry.get('url')]
+        if not scored:
+            return None
+        score, entry = max(scored, key=lambda item: item[0])
+        return entry, score
+
+SPOTIFY_API_URL = 'https://api.spotify.com/v1'
+SPOTIFY_TOKEN_URL = 'https://accounts.spotify.com/api/token'
+
+class SpotifyError(Exception):
+    """The Spotify Web API returned an error."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f'Spotify API error {status}: {message}')
+        self.status = status
+
+class SpotifyClient:
+    """Async Spotify Web API client using the client credentials flow.
+    
+    Requests share one pooled aiohttp session and go through the scheduler's
+    'spotify' bucket when one is given.  The API and token URLs can be pointed
+    at a local server for testing.
+    """
+
+    def __init__(self, client_id: str, client_secret: str, *, scheduler: Optional['RequestScheduler'] = None,
+                 api_url: str = SPOTIFY_API_URL, token_url: str = SPOTIFY_TOKEN_URL,
+                 max_connections: int = 10):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.scheduler = scheduler
+        self.api_url = api_url.rstrip('/')
+        self.token_url = token_url
+        self.max_connections = max_connections
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._token: Optional[str] = None
+        self._token_expires = 0.0
+        self._token_lock = asyncio.Lock()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=10)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    async def get_token(self) -> str:
+        """Get a cached access token, refreshing it shortly before it expires."""
+        async with self._token_lock:
+            if self._token and time.monotonic() < self._token_expires - 60:
+                return self._token
+            
+            async with self._get_session().post(
+                self.token_url,
+                data={'grant_type': 'client_credentials'},
+                auth=aiohttp.BasicAuth(self.client_id, self.client_secret)
+            ) as response:
+                if response.status == 429:
+                    raise RateLimited('spotify', float(response.headers.get('Retry-After', THROTTLE_BACKOFF)))
+                if response.status != 200:
+                    raise SpotifyError(response.status, await response.text())
+                payload = await response.json()
+            
+            self._token = payload['access_token']
+            self._token_expires = time.monotonic() + payload.get('expires_in', 3600)
+            return self._token
+
+    async def _request(self, path: str, params: Optional[dict] = None) -> dict:
+        for attempt in range(2):
+            token = await self.get_token()
+            async with self._get_session().get(
+                f'{self.api_url}{path}',
+                params=params,
+                headers={'Authorization': f'Bearer {token}'}
+            ) as response:
+                if response.status == 429:
+                    raise RateLimited('spotify', float(response.headers.get('Retry-After', THROTTLE_BACKOFF)))
+                if response.status == 401 and attempt == 0:
+                    # Token revoked or expired early, fetch a new one once
+                    self._token = None
+                    continue
+                if response.status != 200:
+                    raise SpotifyError(response.status, await response.text())
+                return await response.json()
+
+    async def get(self, path: str, params: Optional[dict] = None, priority: int = PRIORITY_INTERACTIVE) -> dict:
+        """GET an API path, within the rate limit if a scheduler is set."""
+        if self.scheduler:
+            return await self.scheduler.call('spotify', self._request, path, params, priority=priority)
+        return await self._request(path, params)
+
+    async def get_all_items(self, path: str, first_page: dict, page_size: int, priority: int) -> List[dict]:
+        """Get the items of every page of a paging object, fetching the remaining pages concurrently."""
+        offsets = range(len(first_page['items']), first_page['total'], page_size)
+        pages = await asyncio.gather(*(
+            self.get(path, {'limit': page_size, 'offset': offset}, priority) for offset in offsets
+        ))
+        items = list(first_page['items'])
+        for page in pages:
+            items.extend(page['items'])
+        return items
+
+    async def track(self, track_id: str, priority: int = PRIORITY_INTERACTIVE) -> dict:
+        return await self.get(f'/tracks/{track_id}', priority=priority)
+
+    async def playlist_tracks(self, playlist_id: str, priority: int = PRIORITY_BACKGROUND) -> List[dict]:
+        """Get every track of a playlist, skipping local files, podcast episodes and removed tracks."""
+        path = f'/playlists/{playlist_id}/tracks'
+        first_page = await self.get(path, {'limit': 100, 'offset': 0}, priority)
+        items = await self.get_all_items(path, first_page, 100, priority)
+        return [
+            item['track'] for item in items
+            if item.get('track') and not item['track'].get('is_local') and item['track'].get('type') == 'track'
+        ]
+
+    async def album_tracks(self, album_id: str, priority: int = PRIORITY_BACKGROUND) -> List[dict]:
+        """Get every track of an album, with the album attached for thumbnails."""
+        album = await self.get(f'/albums/{album_id}', priority=priority)
+        tracks = await self.get_all_items(f'/albums/{album_id}/tracks', album['tracks'], 50, priority)
+        album_info = {'name': album.get('name'), 'images': album.get('images', [])}
+        for track in tracks:
+            track.setdefault('album', album_info)
+        return tracks
+
+# Enhanced audio processing options with better error handling
+FFMPEG_BEFORE_OPTIONS = '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
+FILTER_PRESETS = {
+    'default': (
+        'volume=2.0,'  # Increase volume
+        'loudnorm=I=-16:TP=-1.5:LRA=11,'  # Normalize audio levels
+        'equalizer=f=1000:width_type=h:width=200:g=3,'  # Boost mid frequencies
+        'equalizer=f=3000:width_type=h:width=200:g=2,'  # Boost high-mid frequencies
+        'equalizer=f=8000:width_type=h:width=200:g=1,'  # Slight boost to high frequencies
+        'aresample=48000,'  # Resample to 48kHz
+        'aformat=sample_fmts=s16:channel_layouts=stereo'  # Ensure stereo output
+    ),
+}
+OPUS_BITRATE = 128  # kbps of shared Opus streams
+
+# Shared streams
+SHARED_GUILD_ID = 0  # Supervisor key of FFmpeg processes shared by several guilds
+SHARED_BUFFER_FRAMES = 1500  # 30s of Opus frames kept for listeners that lag behind
+SHARED_JOIN_FRAMES = 500  # New listeners may join a stream during its first 10s
+
+class SharedStreamReader(discord.AudioSource):
+    """One guild's cursor into a SharedEncoder."""
+
+    def __init__(self, encoder: 'SharedEncoder', guild_id: int):
+        self.encoder = encoder
+        self.guild_id = guild_id
+        self.cursor = 0
+
+    @property
+    def ffmpeg_source(self) -> SupervisedFFmpegMixin:
+        return self.encoder.source
+
+    def read(self) -> bytes:
+        data, self.cursor = self.encoder.read(self.cursor)
+        if data:
+            self.cursor += 1
+        return data
+
+    def is_opus(self) -> bool:
+        return True
+
+    @property
+    def _current_error(self) -> Optional[Exception]:
+        return getattr(self.encoder.source, '_current_error', None)
+
+    def cleanup(self):
+        self.encoder.detach(self)
+
+class SharedEncoder:
+    """One FFmpeg/Opus encode fanned out to every guild playing the same stream.
+    
+    Frames are kept in a ring buffer.  Each listener reads it with its own
+    cursor and whichever listener is furthest ahead pulls the next frame
+    from FFmpeg.
+    """
+
+    def __init__(self, registry: 'SharedSourceRegistry', key: tuple, source: SupervisedFFmpegMixin, stream: dict):
+        self.registry = registry
+        self.key = key
+        self.source = source
+        self.stream = stream  # stream_url and stream_duration of the resolved stream
+        self.frames = deque(maxlen=SHARED_BUFFER_FRAMES)
+        self.head = 0  # Index of the next frame FFmpeg will produce
+        self.finished = False
+        self.readers: List[SharedStreamReader] = []
+        self.closed = False  # The last listener left and FFmpeg was killed
+        self._lock = threading.Lock()  # Guards the buffer and readers, never held across FFmpeg reads
+        self._pull_lock = threading.Lock()  # One player thread at a time pulls from FFmpeg
+
+    def joinable(self) -> bool:
+        """Whether a new listener would still hear the stream from its start."""
+        return (not self.closed and not self.finished and self.head < SHARED_JOIN_FRAMES
+                and self.source.is_running())
+
+    def attach(self, guild_id: int, force: bool = False) -> Optional[SharedStreamReader]:
+        """Add a listener, or return None if the stream can't be joined anymore.
+        
+        ``force`` joins a stream that isn't joinable, unless it was closed.
+        """
+        with self._lock:
+            if self.closed or not (force or self.joinable()):
+                return None
+            reader = SharedStreamReader(self, guild_id)
+            self.readers.append(reader)
+        return reader
+
+    def detach(self, reader: SharedStreamReader):
+        with self._lock:
+            if reader not in self.readers:
+                return
+            self.readers.remove(reader)
+            if self.readers:
+                return
+            self.closed = True
+        self.registry.discard(self)
+        self.source.cleanup()
+
+    def _buffered(self, cursor: int) -> Optional[tuple]:
+        oldest = self.head - len(self.frames)
+        if cursor < oldest:
+            # Listener fell out of the buffer (e.g. paused too long), skip ahead
+            cursor = oldest
+        if cursor < self.head:
+            return self.frames[cursor - oldest], cursor
+        if self.finished:
+            return b'', cursor
+        return None
+
+    def read(self, cursor: int) -> tuple:
+        """Get the frame at ``cursor`` and the cursor it was actually read at."""
+        with self._lock:
+            buffered = self._buffered(cursor)
+        if buffered:
+            return buffered
+        
+        with self._pull_lock:
+            # Another listener may have pulled the frame while we waited
+            with self._lock:
+                buffered = self._buffered(cursor)
+            if buffered:
+                return buffered
+            
+            data = self.source.read()
+            with self._lock:
+                if not data:
+                    self.finished = True
+                    return b'', cursor
+                self.frames.append(data)
+                self.head += 1
+                return data, self.head - 1
+
+class SharedSourceRegistry:
+    """Share encoders between guilds playing the same track with the same filters and start offset."""
+
+    def __init__(self):
+        self.encoders: Dict[tuple, SharedEncoder] = {}
+        self._pending: Dict[tuple, asyncio.Task] = {}
+        self._lock = threading.Lock()  # discard() runs on the voice player threads
+
+    def listeners(self, source: SupervisedFFmpegMixin) -> List[int]:
+        """Get the guilds listening to a shared FFmpeg process."""
+        with self._lock:
+            encoders = list(self.encoders.values())
+        for encoder in encoders:
+            if encoder.source is source:
+                return [reader.guild_id for reader in encoder.readers]
+        return []
+
+    def discard(self, encoder: SharedEncoder):
+        with self._lock:
+            if self.encoders.get(encoder.key) is encoder:
+                del self.encoders[encoder.key]
+
+    async def attach(self, key: tuple, guild_id: int, create: Callable) -> SharedStreamReader:
+        """Join the encoder for ``key``, starting one with ``create()`` if none can be joined.
+        
+        ``create`` returns the supervised Opus source and the resolved stream fields.
+        Guilds asking for the same key at once wait on a single ``create``.
+        """
+        while True:
+            with self._lock:
+                encoder = self.encoders.get(key)
+            reader = encoder.attach(guild_id) if encoder else None
+            if reader:
+                return reader
+            
+            task = self._pending.get(key)
+            if task is None:
+                task = self._pending[key] = asyncio.create_task(self._create(key, create))
+            encoder = await asyncio.shield(task)
+            # A fresh stream that already died is still joined so the player reports FFmpeg's error;
+            # None means its listeners all left in the meantime, start another
+            reader = encoder.attach(guild_id) or encoder.attach(guild_id, force=True)
+            if reader:
+                return reader
+
+    async def _create(self, key: tuple, create: Callable) -> SharedEncoder:
+        try:
+            source, stream = await create()
+            encoder = SharedEncoder(self, key, source, stream)
+            with self._lock:
+                self.encoders[key] = encoder
+            return encoder
+        finally:
+            del self._pending[key]
+
+FRAME_SECONDS = discord.opus.Encoder.FRAME_LENGTH / 1000
+CROSSFADE_MAX = 12  # seconds
+PREFETCH_LEAD = 15  # seconds before the fade starts to prepare the next song
+
+class PlaybackSource(discord.AudioSource):
+    """Audio source with a playback clock that can crossfade into a prefetched next song.
+    
+    The position is counted from the 20ms frames handed to the voice player,
+    so it stays accurate across pauses and seeks.  ``on_near_end`` and
+    ``on_track_change`` are called from the voice player thread.
+    """
+
+    def __init__(self, song: dict, source: discord.AudioSource, *, start_offset: float = 0,
+                 crossfade: int = 0, on_near_end: Optional[Callable] = None,
+                 on_track_change: Optional[Callable] = None):
+        self.song = song
+        self.source = source
+        self.start_offset = start_offset
+        self.frames = 0
+        self.crossfade = crossfade
+        self.next_song: Optional[dict] = None
+        self.next_source: Optional[discord.AudioSource] = None
+        self.next_frames = 0
+        self.on_near_end = on_near_end
+        self.on_track_change = on_track_change
+        self._near_end_fired = False
+        self._lock = threading.RLock()
+
+    @property
+    def position(self) -> float:
+        """Current playback position in seconds."""
+        return self.start_offset + self.frames * FRAME_SECONDS
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left in the current song, if its duration is known.
+        
+        The resolved stream's duration is preferred, queue metadata (e.g.
+        Spotify's) can be tens of seconds off the video actually played.
+        """
+        duration = self.song.get('stream_duration') or self.song.get('duration')
+        if not duration:
+            return None
+        return duration - self.position
+
+    def sources(self) -> List[discord.AudioSource]:
+        """Get the current and prefetched sources."""
+        return [source for source in (self.source, self.next_source) if source is not None]
+
+    def set_next(self, song: dict, source: discord.AudioSource):
+        """Attach the prefetched next song."""
+        with self._lock:
+            previous = self.next_source
+            self.next_song, self.next_source, self.next_frames = song, source, 0
+        if previous is not None:
+            previous.cleanup()
+
+    def drop_next(self):
+        """Forget the prefetched song so it gets prefetched again or played the normal way."""
+        with self._lock:
+            previous = self.next_source
+            self.next_song, self.next_source, self.next_frames = None, None, 0
+            self._near_end_fired = False
+        if previous is not None:
+            previous.cleanup()
+
+    def replace_source(self, source: discord.AudioSource, start_offset: float) -> discord.AudioSource:
+        """Swap in a source of the same song starting at ``start_offset`` and return the old one."""
+        with self._lock:
+            old = self.source
+            self.source = source
+            self.start_offset = start_offset
+            self.frames = 0
+            self._near_end_fired = False
+        return old
+
+    def read(self) -> bytes:
+        # Inner reads block on FFmpeg's pipe (e.g. while it reconnects), so the lock only
+        # guards the bookkeeping around them and swaps from the event loop never wait on it
+        while True:
+            with self._lock:
+                source = self.source
+            try:
+                data = source.read()
+            except Exception:
+                # A seek may have cleaned the old source up under us
+                if self.source is source:
+                    raise
+                continue
+            
+            with self._lock:
+                if self.source is not source:
+                    continue  # Replaced by a seek during the read, the frame is from the old position
+                
+                remaining = self.remaining()
+                if (self.crossfade and self.on_near_end and not self._near_end_fired
+                        and remaining is not None and remaining <= self.crossfade + PREFETCH_LEAD):
+                    self._near_end_fired = True
+                    self.on_near_end(self)
+                
+                next_source = self.next_source
+                if next_source is None:
+                    if data:
+                        self.frames += 1
+                    return data
+                
+                if data:
+                    self.frames += 1
+                    if self.crossfade <= 0 or remaining is None or remaining >= self.crossfade:
+                        return data
+                    fade_out = max(0.0, remaining / self.crossfade)
+                else:
+                    # Gapless: the next song starts on the frame the current one runs out,
+                    # the duration only times the fade
+                    self._advance()
+            
+            if data:
+                return self._mix(data, source, next_source, fade_out)
+            source.cleanup()
+
+    def _mix(self, data: bytes, source: discord.AudioSource, next_source: discord.AudioSource,
+             fade_out: float) -> bytes:
+        # Opus frames from a shared stream can't be mixed, fall back to a gapless cut
+        if source.is_opus() or next_source.is_opus():
+            return data
+        try:
+            incoming = next_source.read()
+        except Exception:
+            if self.next_source is next_source:
+                raise
+            return data  # Dropped or replaced while we were reading it
+        if incoming:
+            with self._lock:
+                if self.next_source is next_source:
+                    self.next_frames += 1
+        if len(incoming) != len(data):
+            return data
+        return audioop.add(
+            audioop.mul(data, 2, fade_out),
+            audioop.mul(incoming, 2, 1 - fade_out),
+            2
+        )
+
+    def _advance(self):
+        """Make the prefetched song current, the caller holds the lock and cleans up the old source."""
+        self.song, self.source, self.frames = self.next_song, self.next_source, self.next_frames
+        self.start_offset = 0
+        self.next_song, self.next_source, self.next_frames = None, None, 0
+        self._near_end_fired = False
+        
+        if self.on_track_change:
+            self.on_track_change(self, self.song)
+
+    @property
+    def _current_error(self) -> Optional[Exception]:
+        # discord.py's player looks for FFmpeg failures on the source it plays
+        return getattr(self.source, '_current_error', None)
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def cleanup(self):
+        for source in self.sources():
+            source.cleanup()
+
 class Music(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.queues: Dict[int, List[dict]] = {}
         self.now_playing: Dict[int, dict] = {}
         self.cookie_manager = CookieManager()
+        self.scheduler = RequestScheduler()
+        self.matcher = SpotifyMatcher()
+        self.ffmpeg = FFmpegSupervisor()
+        self.shared = SharedSourceRegistry()
+        self.crossfade: Dict[int, int] = {}  # Crossfade seconds per guild
+        self.starting: set = set()  # Guilds with a play_next in flight
         
         # Configure yt-dlp with improved audio quality
         self.ydl_opts = {
@@ -53,18 +1006,79 @@ class Music(commands.Cog):
         self.ydl = yt_dlp.YoutubeDL(self.ydl_opts)
         
         # Initialize Spotify client
-        try:
-            self.spotify = spotipy.Spotify(
-                client_credentials_manager=SpotifyClientCredentials(
-                    client_id=os.getenv('SPOTIFY_CLIENT_ID'),
-                    client_secret=os.getenv('SPOTIFY_CLIENT_SECRET')
-                )
-            )
+        client_id = os.getenv('SPOTIFY_CLIENT_ID')
+        client_secret = os.getenv('SPOTIFY_CLIENT_SECRET')
+        if client_id and client_secret:
+            self.spotify = SpotifyClient(client_id, client_secret, scheduler=self.scheduler)
             logger.info("✅ Spotify client initialized successfully")
-        except Exception as e:
-            logger.error(f"❌ Error initializing Spotify client: {e}")
+        else:
+            logger.error("❌ Error initializing Spotify client: SPOTIFY_CLIENT_ID or SPOTIFY_CLIENT_SECRET not set")
             self.spotify = None
     
+    async def cog_load(self):
+        self.reap_ffmpeg.start()
+        self.save_matches.start()
+    
+    async def cog_unload(self):
+        self.reap_ffmpeg.cancel()
+        self.save_matches.cancel()
+        self.matcher.save()
+        self.ffmpeg.shutdown()
+        if self.spotify:
+            await self.spotify.close()
+    
+    @tasks.loop(seconds=15)
+    async def reap_ffmpeg(self):
+        """Periodically kill stuck and orphaned FFmpeg processes."""
+        await self.ffmpeg.reap(self.get_ffmpeg_state, self.release_reaped)
+    
+    @tasks.loop(seconds=MATCH_SAVE_INTERVAL)
+    async def save_matches(self):
+        """Write new Spotify matches off the event loop, batched."""
+        cache = self.matcher.snapshot()
+        if cache is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.matcher.write, cache)
+    
+    def release_reaped(self, source: SupervisedFFmpegMixin):
+        """Drop a reaped prefetched source so the song is opened again when it's due.
+        
+        A reaped paused source is reopened by ``resume``.
+        """
+        guild_ids = self.shared.listeners(source) if source.guild_id == SHARED_GUILD_ID else [source.guild_id]
+        for guild_id in guild_ids:
+            guild = self.bot.get_guild(guild_id)
+            playback = self.get_playback(guild) if guild else None
+            if playback and playback.next_source is not None and \
+                    getattr(playback.next_source, 'ffmpeg_source', playback.next_source) is source:
+                playback.drop_next()
+    
+    def get_ffmpeg_state(self, source: SupervisedFFmpegMixin) -> Optional[str]:
+        """Get whether a source is playing, paused or detached from every voice client using it."""
+        if source.guild_id == SHARED_GUILD_ID:
+            guild_ids = self.shared.listeners(source)
+        else:
+            guild_ids = [source.guild_id]
+        
+        states = [self.get_guild_ffmpeg_state(guild_id, source) for guild_id in guild_ids]
+        for state in ('playing', 'paused', 'prefetched'):
+            if state in states:
+                return state
+        return None
+    
+    def get_guild_ffmpeg_state(self, guild_id: int, source: SupervisedFFmpegMixin) -> Optional[str]:
+        """Get what a guild's voice client is doing with a source."""
+        guild = self.bot.get_guild(guild_id)
+        playback = self.get_playback(guild) if guild else None
+        if not playback:
+            return None
+        # Shared readers stand in for the FFmpeg process they read from
+        ffmpeg_sources = [getattr(attached, 'ffmpeg_source', attached) for attached in playback.sources()]
+        if source not in ffmpeg_sources:
+            return None
+        if source is not ffmpeg_sources[0]:
+            return 'prefetched'
+        return 'paused' if guild.voice_client.is_paused() else 'playing'
+    
     def get_ydl_opts(self):
         """Get yt-dlp options with current cookies file."""
         opts = self.ydl_opts.copy()
@@ -81,130 +1095,266 @@ class Music(commands.Cog):
             self.queues[guild_id] = []
         self.queues[guild_id].append(song)
     
-    async def play_next(self, ctx):
-        """Play the next song in the queue."""
-        queue = self.get_queue(ctx.guild.id)
-        if not queue:
-            return
+    def get_service(self, url: str) -> str:
+        """Get the rate limited service yt-dlp talks to for a URL."""
+        return 'soundcloud' if 'soundcloud.com' in url else 'youtube'
+    
+    async def extract_info(self, ydl: yt_dlp.YoutubeDL, url: str, priority: int = PRIORITY_INTERACTIVE, **kwargs) -> dict:
+        """Run ``ydl.extract_info`` off the event loop within the service's rate limit."""
+        return await self.scheduler.call(
+            self.get_service(url), ydl.extract_info, url, download=False, priority=priority, **kwargs
+        )
+    
+    async def resolve_stream(self, song: dict, priority: int = PRIORITY_INTERACTIVE) -> dict:
+        """Resolve the direct stream URL of a song and the duration of that stream."""
+        with yt_dlp.YoutubeDL(self.get_ydl_opts()) as ydl:
+            try:
+                info = await self.extract_info(ydl, song['url'], priority)
+            except Exception as e:
+                logger.error("❌ Error extracting info: %s", e)
+                # If it's a SoundCloud URL, try to get a different format
+                if 'soundcloud.com' not in song['url']:
+                    raise
+                try:
+                    info = await self.extract_info(ydl, song['url'], priority, format='bestaudio/best')
+                except Exception as e2:
+                    logger.error("❌ Error getting alternative format: %s", e2)
+                    raise
+        return {'stream_url': info['url'], 'stream_duration': info.get('duration')}
+    
+    def get_ffmpeg_options(self, start_offset: float = 0, opus: bool = False, preset: str = 'default') -> dict:
+        """Get FFmpeg options, seeking the input to ``start_offset`` seconds."""
+        options = {
+            'before_options': FFMPEG_BEFORE_OPTIONS,
+            'options': f'-vn -af "{FILTER_PRESETS[preset]}"'  # Disable video, apply filters
+        }
+        if opus:
+            options['bitrate'] = OPUS_BITRATE
+        else:
+            options['options'] += (
+                ' -ar 48000'  # Set sample rate
+                ' -ac 2'      # Set to stereo
+                ' -b:a 320k'  # Set bitrate
+            )
+        if start_offset:
+            options['before_options'] = f"-ss {start_offset:.2f} {options['before_options']}"
+        return options
+    
+    async def open_source(self, guild_id: int, song: dict, start_offset: float = 0,
+                          priority: int = PRIORITY_INTERACTIVE) -> discord.AudioSource:
+        """Open the audio of a song.
         
-        song = queue.pop(0)
-        self.now_playing[ctx.guild.id] = song
+        Guilds with crossfade get their own PCM FFmpeg process so frames can be
+        mixed, the others join a shared Opus encode of the same track.
+        """
+        if self.crossfade.get(guild_id):
+            if not song.get('stream_url'):
+                song.update(await self.resolve_stream(song, priority))
+            return await self.ffmpeg.spawn(guild_id, song['stream_url'], **self.get_ffmpeg_options(start_offset))
+        
+        async def create():
+            if song.get('stream_url'):
+                stream = {'stream_url': song['stream_url'], 'stream_duration': song.get('stream_duration')}
+            else:
+                stream = await self.resolve_stream(song, priority)
+            source = await self.ffmpeg.spawn(
+                SHARED_GUILD_ID, stream['stream_url'], opus=True, **self.get_ffmpeg_options(start_offset, opus=True)
+            )
+            return source, stream
+        
+        # Stream URLs are signed per extraction, the page URL identifies the track
+        key = song.get('webpage_url') or song['url']
+        reader = await self.shared.attach((key, 'default', start_offset), guild_id, create)
+        song.update(reader.encoder.stream)
+        return reader
+    
+    def get_playback(self, guild: discord.Guild) -> Optional[PlaybackSource]:
+        """Get the playback source of a guild's voice client."""
+        voice_client = guild.voice_client
+        source = voice_client.source if voice_client else None
+        return source if isinstance(source, PlaybackSource) else None
+    
+    def build_now_playing_embed(self, song: dict, queue: List[dict], position: Optional[float] = None) -> discord.Embed:
+        """Create the now playing embed."""
+        embed = discord.Embed(
+            title='🎵 Đang phát',
+            description=f'**{song["title"]}**',
+            color=discord.Color.blue()
+        )
+        
+        if song.get('thumbnail'):
+            embed.set_thumbnail(url=song['thumbnail'])
+            
+        if song.get('duration'):
+            duration = str(timedelta(seconds=song['duration']))
+            if position is not None:
+                duration = f'{timedelta(seconds=int(position))} / {duration}'
+            embed.add_field(
+                name='⏱️ Thời lượng',
+                value=duration,
+                inline=True
+            )
         
-        # Get the voice client
+        # Add queue info
+        if queue:
+            embed.add_field(
+                name='📋 Queue',
+                value=f'Còn {len(queue)} bài hát trong queue',
+                inline=True
+            )
+        
+        return embed
+    
+    def is_busy(self, ctx) -> bool:
+        """Whether a song is playing, paused or being started in the guild."""
         voice_client = ctx.voice_client
-        if not voice_client:
-            return
+        return ctx.guild.id in self.starting or bool(
+            voice_client and (voice_client.is_playing() or voice_client.is_paused())
+        )
+    
+    async def play_next(self, ctx):
+        """Play the next song in the queue, unless the guild is already busy.
         
+        Opening a song awaits extraction, so without the starting flag two
+        ``play`` commands could both start a song on the same voice client.
+        """
+        if self.is_busy(ctx):
+            return
+        self.starting.add(ctx.guild.id)
         try:
-            # Download and play the song with current cookies
-            with yt_dlp.YoutubeDL(self.get_ydl_opts()) as ydl:
+            await self.start_next(ctx)
+        finally:
+            self.starting.discard(ctx.guild.id)
+    
+    async def start_next(self, ctx):
+        """Start the first playable song in the queue, the caller holds the starting flag."""
+        while True:
+            queue = self.get_queue(ctx.guild.id)
+            if not queue:
+                return
+            
+            song = queue.pop(0)
+            self.now_playing[ctx.guild.id] = song
+            
+            # Get the voice client
+            voice_client = ctx.voice_client
+            if not voice_client:
+                return
+            
+            try:
+                # Resolve the stream with current cookies, or join a guild already playing it
+                if self.ffmpeg.full():
+                    await ctx.send('⏳ Máy chủ đang bận, bài hát sẽ phát khi có chỗ trống...')
                 try:
-                    info = ydl.extract_info(song['url'], download=False)
-                    url = info['url']
+                    source = await self.open_source(ctx.guild.id, song)
+                except FFmpegBusy:
+                    # Keep the song, the queue would otherwise drain one timeout at a time
+                    queue.insert(0, song)
+                    self.now_playing.pop(ctx.guild.id, None)
+                    await ctx.send('❌ Máy chủ đang quá tải, hãy thử lại sau!')
+                    return
                 except Exception as e:
-                    logger.error(f"❌ Error extracting info: {e}")
-                    # If it's a SoundCloud URL, try to get a different format
-                    if 'soundcloud.com' in song['url']:
-                        try:
-                            # Try to get a different format
-                            info = ydl.extract_info(song['url'], download=False, format='bestaudio/best')
-                            url = info['url']
-                        except Exception as e2:
-                            logger.error(f"❌ Error getting alternative format: {e2}")
-                            await ctx.send("❌ Không thể phát bài hát này. Đang chuyển sang bài tiếp theo...")
-                            await self.play_next(ctx)
-                            return
+                    logger.error("❌ Error opening song: %s", e, extra={'guild_id': ctx.guild.id})
+                    if song.get('spotify_id') and get_retry_after(e) is None:
+                        # The matched video may be gone, search again next time
+                        self.matcher.forget(song['spotify_id'], song['url'])
+                    await ctx.send("❌ Không thể phát bài hát này. Đang chuyển sang bài tiếp theo...")
+                    continue
+                
+                # stop or leave may have run while the song was being opened
+                if self.now_playing.get(ctx.guild.id) is not song or ctx.voice_client is not voice_client:
+                    source.cleanup()
+                    return
+                
+                # Add error handling for the play command
+                def after_playing(error):
+                    if error:
+                        logger.error("❌ Error in after_playing: %s", error, extra={'guild_id': ctx.guild.id})
+                        asyncio.run_coroutine_threadsafe(
+                            self.handle_play_error(ctx, error), self.bot.loop
+                        )
                     else:
-                        await ctx.send("❌ Không thể phát bài hát này. Đang chuyển sang bài tiếp theo...")
-                        await self.play_next(ctx)
-                        return
+                        asyncio.run_coroutine_threadsafe(
+                            self.play_next(ctx), self.bot.loop
+                        )
                 
-            # Enhanced audio processing options with better error handling
-            ffmpeg_options = {
-                'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
-                'options': (
-                    '-vn '  # Disable video
-                    '-af "'
-                    'volume=2.0,'  # Increase volume
-                    'loudnorm=I=-16:TP=-1.5:LRA=11,'  # Normalize audio levels
-                    'equalizer=f=1000:width_type=h:width=200:g=3,'  # Boost mid frequencies
-                    'equalizer=f=3000:width_type=h:width=200:g=2,'  # Boost high-mid frequencies
-                    'equalizer=f=8000:width_type=h:width=200:g=1,'  # Slight boost to high frequencies
-                    'aresample=48000,'  # Resample to 48kHz
-                    'aformat=sample_fmts=s16:channel_layouts=stereo'  # Ensure stereo output
-                    '" '
-                    '-ar 48000 '  # Set sample rate
-                    '-ac 2 '      # Set to stereo
-                    '-b:a 320k'   # Set bitrate
-                )
-            }
-            
-            # Add error handling for the play command
-            def after_playing(error):
-                if error:
-                    logger.error(f"❌ Error in after_playing: {error}")
+                def near_end(playback):
                     asyncio.run_coroutine_threadsafe(
-                        self.handle_play_error(ctx, error), self.bot.loop
+                        self.prefetch_next(ctx, playback), self.bot.loop
                     )
-                else:
+                
+                def track_changed(playback, next_song):
                     asyncio.run_coroutine_threadsafe(
-                        self.play_next(ctx), self.bot.loop
+                        self.announce_track_change(ctx, next_song), self.bot.loop
                     )
-            
-            voice_client.play(
-                discord.FFmpegPCMAudio(url, **ffmpeg_options),
-                after=after_playing
-            )
-            
-            # Create now playing embed
-            embed = discord.Embed(
-                title='🎵 Đang phát',
-                description=f'**{song["title"]}**',
-                color=discord.Color.blue()
-            )
-            
-            if song.get('thumbnail'):
-                embed.set_thumbnail(url=song['thumbnail'])
                 
-            if song.get('duration'):
-                duration = str(timedelta(seconds=song['duration']))
-                embed.add_field(
-                    name='⏱️ Thời lượng',
-                    value=duration,
-                    inline=True
-                )
-            
-            # Add queue info
-            if queue:
-                embed.add_field(
-                    name='📋 Queue',
-                    value=f'Còn {len(queue)} bài hát trong queue',
-                    inline=True
+                playback = PlaybackSource(
+                    song, source,
+                    crossfade=self.crossfade.get(ctx.guild.id, 0),
+                    on_near_end=near_end,
+                    on_track_change=track_changed
                 )
-            
-            await ctx.send(embed=embed)
-            
+                try:
+                    voice_client.play(playback, after=after_playing)
+                except Exception:
+                    playback.cleanup()
+                    raise
+                
+                await ctx.send(embed=self.build_now_playing_embed(song, queue))
+                return
+            except Exception as e:
+                logger.error('❌ Error playing song: %s', e, extra={'guild_id': ctx.guild.id})
+                await self.report_play_error(ctx, e)
+    
+    async def prefetch_next(self, ctx, playback: PlaybackSource):
+        """Start FFmpeg for the next queued song so it can be crossfaded in."""
+        queue = self.get_queue(ctx.guild.id)
+        if not queue:
+            return
+        
+        song = queue[0]
+        try:
+            source = await self.open_source(ctx.guild.id, song, priority=PRIORITY_BACKGROUND)
         except Exception as e:
-            logger.error(f'❌ Error playing song: {e}')
-            await self.handle_play_error(ctx, e)
+            # play_next will retry it the normal way once the current song ends
+            logger.error("❌ Error prefetching next song: %s", e, extra={'guild_id': ctx.guild.id})
+            return
+        
+        # Playback may have been stopped or skipped while we were extracting
+        if self.get_playback(ctx.guild) is not playback:
+            source.cleanup()
+            return
+        playback.set_next(song, source)
+    
+    async def announce_track_change(self, ctx, song: dict):
+        """Update the queue after the playback source moved on to the prefetched song."""
+        queue = self.get_queue(ctx.guild.id)
+        if queue and queue[0] is song:
+            queue.pop(0)
+        self.now_playing[ctx.guild.id] = song
+        await ctx.send(embed=self.build_now_playing_embed(song, queue))
+    
+    async def report_play_error(self, ctx, error):
+        """Tell the guild about a play error and stop the current playback."""
+        # If the error is related to streaming, try to skip to next song
+        if "403" in str(error) or "Forbidden" in str(error):
+            await ctx.send("❌ Lỗi khi phát bài hát. Đang chuyển sang bài tiếp theo...")
+        else:
+            await ctx.send(f"❌ Có lỗi xảy ra khi phát bài hát: {str(error)}")
+        
+        # Stop current playback
+        if ctx.voice_client and ctx.voice_client.is_playing():
+            ctx.voice_client.stop()
     
     async def handle_play_error(self, ctx, error):
         """Handle play errors and attempt recovery."""
         try:
-            # If the error is related to streaming, try to skip to next song
-            if "403" in str(error) or "Forbidden" in str(error):
-                await ctx.send("❌ Lỗi khi phát bài hát. Đang chuyển sang bài tiếp theo...")
-            else:
-                await ctx.send(f"❌ Có lỗi xảy ra khi phát bài hát: {str(error)}")
-            
-            # Stop current playback
-            if ctx.voice_client and ctx.voice_client.is_playing():
-                ctx.voice_client.stop()
+            await self.report_play_error(ctx, error)
             
             # Try to play next song
             await self.play_next(ctx)
         except Exception as e:
-            logger.error(f"❌ Error in handle_play_error: {e}")
+            logger.error("❌ Error in handle_play_error: %s", e, extra={'guild_id': ctx.guild.id})
             await ctx.send("❌ Có lỗi xảy ra khi xử lý lỗi phát nhạc!")
     
     def is_youtube_url(self, url: str) -> bool:
@@ -242,7 +1392,7 @@ class Music(commands.Cog):
         """Get all songs from a YouTube playlist or video, always fetch full info for each entry."""
         try:
             with yt_dlp.YoutubeDL(self.get_ydl_opts()) as ydl:
-                info = ydl.extract_info(url, download=False)
+                info = await self.extract_info(ydl, url)
                 songs = []
                 if 'entries' in info:
                     for entry in info['entries']:
@@ -253,20 +1403,24 @@ class Music(commands.Cog):
                             video_id = entry.get('id')
                             if video_id:
                                 try:
-                                    video_info = ydl.extract_info(f'https://www.youtube.com/watch?v={video_id}', download=False)
+                                    video_info = await self.extract_info(
+                                        ydl, f'https://www.youtube.com/watch?v={video_id}', PRIORITY_BACKGROUND
+                                    )
                                     songs.append({
                                         'title': video_info.get('title', 'Unknown Title'),
                                         'url': video_info.get('url', ''),
+                                        'webpage_url': video_info.get('webpage_url'),
                                         'duration': video_info.get('duration', 0),
                                         'thumbnail': video_info.get('thumbnail', '')
                                     })
                                 except Exception as e:
-                                    logger.error(f"❌ Error fetching video info for {video_id}: {e}")
+                                    logger.error("❌ Error fetching video info for %s: %s", video_id, e)
                                     continue
                         else:
                             songs.append({
                                 'title': entry.get('title', 'Unknown Title'),
                                 'url': entry.get('url', ''),
+                                'webpage_url': entry.get('webpage_url'),
                                 'duration': entry.get('duration', 0),
                                 'thumbnail': entry.get('thumbnail', '')
                             })
@@ -275,13 +1429,50 @@ class Music(commands.Cog):
                 return [{
                     'title': info.get('title', 'Unknown Title'),
                     'url': info.get('url', ''),
+                    'webpage_url': info.get('webpage_url'),
                     'duration': info.get('duration', 0),
                     'thumbnail': info.get('thumbnail', '')
                 }]
         except Exception as e:
-            logger.error(f"❌ Error getting YouTube playlist: {e}")
+            logger.error("❌ Error getting YouTube playlist: %s", e)
             return []
 
+    async def match_spotify_track(self, track: dict, priority: int = PRIORITY_INTERACTIVE) -> dict:
+        """Find the YouTube video for a Spotify track, using the cached mapping when there is one."""
+        artist = track['artists'][0]['name']
+        title = track['name']
+        
+        # Lấy thumbnail an toàn
+        album_info = track.get('album', {}) if isinstance(track.get('album'), dict) else {}
+        images = album_info.get('images', [])
+        
+        song = {
+            'title': f"{artist} - {title}",
+            'duration': track.get('duration_ms', 0) // 1000,
+            'thumbnail': images[0]['url'] if images else '',
+            'spotify_id': track.get('id'),
+        }
+        
+        cached = self.matcher.get(track['id']) if track.get('id') else None
+        if cached:
+            song['url'] = cached['url']
+            return song
+        
+        # Search on YouTube, top results in one flat request
+        search_query = self.matcher.search_query(track)
+        with yt_dlp.YoutubeDL(self.get_ydl_opts()) as ydl:
+            info = await self.extract_info(ydl, f"ytsearch{MATCH_CANDIDATES}:{search_query}", priority)
+        
+        match = self.matcher.best_match(track, info.get('entries') or [])
+        if not match:
+            raise ValueError(f'No YouTube results for {search_query}')
+        entry, score = match
+        if track.get('id') and score >= MATCH_MIN_SCORE:
+            self.matcher.remember(track['id'], entry, score)
+        
+        song['url'] = entry['url']
+        return song
+    
     async def get_spotify_track_info(self, url: str) -> Optional[dict]:
         """Get track information from Spotify URL."""
         if not self.spotify:
@@ -290,25 +1481,10 @@ class Music(commands.Cog):
         try:
             # Extract track ID from URL
             track_id = url.split('/')[-1].split('?')[0]
-            track = self.spotify.track(track_id)
-            
-            # Get artist and title
-            artist = track['artists'][0]['name']
-            title = track['name']
-            
-            # Search on YouTube
-            search_query = f"{artist} - {title} audio"
-            with yt_dlp.YoutubeDL(self.get_ydl_opts()) as ydl:
-                info = ydl.extract_info(f"ytsearch:{search_query}", download=False)['entries'][0]
-                
-            return {
-                'title': f"{artist} - {title}",
-                'url': info['url'],
-                'duration': track['duration_ms'] // 1000,
-                'thumbnail': track['album']['images'][0]['url'] if track['album']['images'] else ''
-            }
+            track = await self.spotify.track(track_id)
+            return await self.match_spotify_track(track)
         except Exception as e:
-            logger.error(f"❌ Error getting Spotify track info: {e}")
+            logger.error("❌ Error getting Spotify track info: %s", e)
             return None
     
     async def get_spotify_playlist_info(self, url: str) -> List[dict]:
@@ -319,37 +1495,19 @@ class Music(commands.Cog):
             clean_url = url.split('?')[0]
             playlist_id = clean_url.split('/')[-1]
             if 'playlist' in clean_url:
-                playlist = self.spotify.playlist(playlist_id)
-                tracks = playlist['tracks']['items']
+                tracks = await self.spotify.playlist_tracks(playlist_id)
             else:  # album
-                album = self.spotify.album(playlist_id)
-                tracks = album['tracks']['items']
+                tracks = await self.spotify.album_tracks(playlist_id)
             songs = []
-            for item in tracks:
-                track = item['track'] if 'track' in item else item
-                artist = track['artists'][0]['name']
-                title = track['name']
-                # Lấy thumbnail an toàn
-                album_info = track.get('album', {}) if isinstance(track.get('album'), dict) else {}
-                images = album_info.get('images', [])
-                thumbnail = images[0]['url'] if images else ''
-                # Search on YouTube
-                search_query = f"{artist} - {title} audio"
-                with yt_dlp.YoutubeDL(self.get_ydl_opts()) as ydl:
-                    try:
-                        info = ydl.extract_info(f"ytsearch:{search_query}", download=False)['entries'][0]
-                        songs.append({
-                            'title': f"{artist} - {title}",
-                            'url': info['url'],
-                            'duration': track.get('duration_ms', 0) // 1000,
-                            'thumbnail': thumbnail
-                        })
-                    except Exception as e:
-                        logger.error(f"❌ Error getting track info for {title}: {e}")
-                        continue
+            for track in tracks:
+                try:
+                    songs.append(await self.match_spotify_track(track, PRIORITY_BACKGROUND))
+                except Exception as e:
+                    logger.error("❌ Error getting track info for %s: %s", track.get('name'), e)
+                    continue
             return songs
         except Exception as e:
-            logger.error(f"❌ Error getting Spotify playlist info: {e}")
+            logger.error("❌ Error getting Spotify playlist info: %s", e)
             return []
 
     async def get_soundcloud_playlist(self, url: str) -> List[dict]:
@@ -360,7 +1518,7 @@ class Music(commands.Cog):
             
             with yt_dlp.YoutubeDL(self.get_ydl_opts()) as ydl:
                 # First get the playlist info
-                playlist = ydl.extract_info(clean_url, download=False)
+                playlist = await self.extract_info(ydl, clean_url)
                 songs = []
                 
                 if 'entries' in playlist:
@@ -375,16 +1533,17 @@ class Music(commands.Cog):
                                 continue
                                 
                             # Get full track info
-                            track_info = ydl.extract_info(track_url, download=False)
+                            track_info = await self.extract_info(ydl, track_url, PRIORITY_BACKGROUND)
                             
                             songs.append({
                                 'title': track_info.get('title', 'Unknown Title'),
                                 'url': track_info.get('url', ''),
+                                'webpage_url': track_info.get('webpage_url'),
                                 'duration': track_info.get('duration', 0),
                                 'thumbnail': track_info.get('thumbnail', '')
                             })
                         except Exception as e:
-                            logger.error(f"❌ Error fetching SoundCloud track info: {e}")
+                            logger.error("❌ Error fetching SoundCloud track info: %s", e)
                             continue
                             
                     return songs
@@ -393,12 +1552,13 @@ class Music(commands.Cog):
                 return [{
                     'title': playlist.get('title', 'Unknown Title'),
                     'url': playlist.get('url', ''),
+                    'webpage_url': playlist.get('webpage_url'),
                     'duration': playlist.get('duration', 0),
                     'thumbnail': playlist.get('thumbnail', '')
                 }]
                 
         except Exception as e:
-            logger.error(f"❌ Error getting SoundCloud playlist: {e}")
+            logger.error("❌ Error getting SoundCloud playlist: %s", e)
             return []
     
     @commands.hybrid_command(name='play', description='Phát nhạc từ YouTube, Spotify hoặc SoundCloud', aliases=['p'])
@@ -432,7 +1592,7 @@ class Music(commands.Cog):
                     self.add_to_queue(ctx.guild.id, song)
                 
                 # If nothing is playing, start playing
-                if not ctx.voice_client.is_playing():
+                if not self.is_busy(ctx):
                     await self.play_next(ctx)
                 else:
                     embed = discord.Embed(
@@ -474,16 +1634,21 @@ class Music(commands.Cog):
             else:
                 # Search for the song with current cookies
                 with yt_dlp.YoutubeDL(self.get_ydl_opts()) as ydl:
-                    try:
-                        # Try to extract info directly if it's a URL
-                        info = ydl.extract_info(query, download=False)
-                    except:
-                        # If not a URL, search for it
-                        info = ydl.extract_info(f"ytsearch:{query}", download=False)['entries'][0]
+                    info = None
+                    if re.match(r'^https?://', query):
+                        try:
+                            # Try to extract info directly if it's a URL
+                            info = await self.extract_info(ydl, query)
+                        except Exception as e:
+                            logger.error("❌ Error extracting info: %s", e)
+                    if info is None:
+                        # Plain text costs a single search request
+                        info = (await self.extract_info(ydl, f"ytsearch:{query}"))['entries'][0]
                     
                     song = {
                         'title': info['title'],
                         'url': info['url'],
+                        'webpage_url': info.get('webpage_url'),
                         'duration': info.get('duration', 0),
                         'thumbnail': info.get('thumbnail', '')
                     }
@@ -492,7 +1657,7 @@ class Music(commands.Cog):
             self.add_to_queue(ctx.guild.id, song)
             
             # If nothing is playing, start playing
-            if not ctx.voice_client.is_playing():
+            if not self.is_busy(ctx):
                 await self.play_next(ctx)
             else:
                 embed = discord.Embed(
@@ -520,7 +1685,7 @@ class Music(commands.Cog):
                 await ctx.send(embed=embed)
                 
         except Exception as e:
-            logger.error(f'❌ Error in play command: {e}')
+            logger.error('❌ Error in play command: %s', e)
             await ctx.send('❌ Có lỗi xảy ra khi tìm kiếm bài hát!')
     
     @commands.hybrid_command(name='skip', description='Bỏ qua bài hát hiện tại', aliases=['s'])
@@ -583,6 +1748,14 @@ class Music(commands.Cog):
         if not ctx.voice_client.is_paused():
             return await ctx.send('❌ Bài hát không đang tạm dừng!')
         
+        # FFmpeg is reaped after a long pause, pick up where it stopped
+        playback = self.get_playback(ctx.guild)
+        if playback and not getattr(playback.source, 'ffmpeg_source', playback.source).is_running():
+            try:
+                await self.restart_source(ctx.guild, playback, playback.position)
+            except FFmpegBusy:
+                return await ctx.send('❌ Máy chủ đang quá tải, hãy thử lại sau!')
+        
         ctx.voice_client.resume()
         embed = discord.Embed(
             title='▶️ Đã tiếp tục phát bài hát',
@@ -641,32 +1814,142 @@ class Music(commands.Cog):
         if not song:
             return await ctx.send('❌ Không có bài hát nào đang phát!')
         
+        playback = self.get_playback(ctx.guild)
+        position = playback.position if playback and playback.song is song else None
+        embed = self.build_now_playing_embed(song, self.get_queue(ctx.guild.id), position)
+        await ctx.send(embed=embed)
+    
+    def parse_position(self, text: str) -> Optional[int]:
+        """Parse a position like ``90``, ``1:30`` or ``1:02:03`` into seconds."""
+        parts = text.strip().split(':')
+        if not 1 <= len(parts) <= 3 or not all(part.isdigit() for part in parts):
+            return None
+        seconds = 0
+        for part in parts:
+            seconds = seconds * 60 + int(part)
+        return seconds
+    
+    async def restart_source(self, guild: discord.Guild, playback: PlaybackSource, seconds: float) -> bool:
+        """Restart FFmpeg of the current song at ``seconds``, False if the song changed meanwhile."""
+        # The stream is already resolved, no re-extraction needed
+        song = playback.song
+        source = await self.open_source(guild.id, song, seconds)
+        if self.get_playback(guild) is not playback or playback.song is not song:
+            source.cleanup()
+            return False
+        
+        old = playback.replace_source(source, seconds)
+        await asyncio.get_running_loop().run_in_executor(None, old.cleanup)
+        return True
+    
+    @commands.hybrid_command(name='seek', description='Tua đến vị trí trong bài hát (vd: 1:30)')
+    async def seek(self, ctx, position: str):
+        """Seek to a position in the current song."""
+        playback = self.get_playback(ctx.guild)
+        if not playback or not playback.song.get('stream_url'):
+            return await ctx.send('❌ Không có bài hát nào đang phát!')
+        
+        seconds = self.parse_position(position)
+        if seconds is None:
+            return await ctx.send('❌ Vị trí không hợp lệ! Ví dụ: `1:30` hoặc `90`')
+        
+        duration = playback.song.get('stream_duration') or playback.song.get('duration')
+        if duration and seconds >= duration:
+            return await ctx.send('❌ Vị trí vượt quá thời lượng bài hát!')
+        
+        try:
+            restarted = await self.restart_source(ctx.guild, playback, seconds)
+        except FFmpegBusy:
+            return await ctx.send('❌ Máy chủ đang quá tải, hãy thử lại sau!')
+        if not restarted:
+            return await ctx.send('❌ Bài hát đã thay đổi trong lúc tua!')
+        
         embed = discord.Embed(
-            title='🎵 Đang phát',
-            description=f'**{song["title"]}**',
+            title=f'⏩ Đã tua đến {timedelta(seconds=seconds)}',
             color=discord.Color.blue()
         )
+        await ctx.send(embed=embed)
+    
+    @commands.hybrid_command(name='crossfade', description='Đặt thời gian chuyển bài mượt (0 để tắt)', aliases=['cf'])
+    async def crossfade_cmd(self, ctx, seconds: Optional[int] = None):
+        """Set the crossfade between consecutive songs."""
+        if seconds is None:
+            current = self.crossfade.get(ctx.guild.id, 0)
+            return await ctx.send(f'🎚️ Crossfade hiện tại: {current}s' if current else '🎚️ Crossfade đang tắt')
         
-        if song.get('thumbnail'):
-            embed.set_thumbnail(url=song['thumbnail'])
-            
-        if song.get('duration'):
-            duration = str(timedelta(seconds=song['duration']))
+        if not 0 <= seconds <= CROSSFADE_MAX:
+            return await ctx.send(f'❌ Crossfade phải trong khoảng 0-{CROSSFADE_MAX} giây!')
+        
+        self.crossfade[ctx.guild.id] = seconds
+        playback = self.get_playback(ctx.guild)
+        if playback:
+            playback.crossfade = seconds
+        
+        embed = discord.Embed(
+            title=f'🎚️ Đã đặt crossfade {seconds}s' if seconds else '🎚️ Đã tắt crossfade',
+            color=discord.Color.green()
+        )
+        await ctx.send(embed=embed)
+    
+    @commands.command(name='ffmpegstats')
+    @commands.is_owner()
+    async def ffmpeg_stats(self, ctx):
+        """Show running FFmpeg processes and recent exits."""
+        active = self.ffmpeg.active()
+        shared = list(self.shared.encoders.values())
+        embed = discord.Embed(
+            title='🛠️ FFmpeg processes',
+            description=(
+                f'Đang chạy: {len(active)}/{self.ffmpeg.max_processes}\n'
+                f'Đang chờ: {self.ffmpeg.waiting}\n'
+                f'Shared streams: {len(shared)} ({sum(len(encoder.readers) for encoder in shared)} guild)'
+            ),
+            color=discord.Color.blue()
+        )
+        
+        lines = []
+        for source in active[:10]:
+            self.ffmpeg.sample(source)
+            owner = 'shared' if source.guild_id == SHARED_GUILD_ID else f'guild {source.guild_id}'
+            lines.append(
+                f'`{source.pid}` {owner} - '
+                f'{time.monotonic() - source.started_at:.0f}s, '
+                f'CPU {source.stats.get("cpu_seconds", 0):.1f}s, '
+                f'RSS {source.stats.get("rss_bytes", 0) / 1048576:.1f}MB'
+            )
+        if lines:
+            embed.add_field(name='▶️ Active', value='\n'.join(lines), inline=False)
+        
+        failed = [entry for entry in self.ffmpeg.history if entry['returncode'] not in (0, -9, None)]
+        if failed:
+            last = failed[-1]
             embed.add_field(
-                name='⏱️ Thời lượng',
-                value=duration,
-                inline=True
+                name=f'⚠️ Last failure (code {last["returncode"]})',
+                value=f'```{(last["stderr"] or "<no stderr>")[-900:]}```',
+                inline=False
             )
         
-        # Add queue info
-        queue = self.get_queue(ctx.guild.id)
-        if queue:
+        await ctx.send(embed=embed)
+    
+    @commands.command(name='ratelimits')
+    @commands.is_owner()
+    async def rate_limits(self, ctx):
+        """Show queue-wait metrics of the upstream API scheduler."""
+        embed = discord.Embed(
+            title='🚦 Rate limits',
+            color=discord.Color.blue()
+        )
+        for service in self.scheduler.buckets:
+            summary = self.scheduler.summary(service)
             embed.add_field(
-                name='📋 Queue',
-                value=f'Còn {len(queue)} bài hát trong queue',
+                name=service,
+                value=(
+                    f'Calls: {summary["calls"]} (429: {summary["throttled"]})\n'
+                    f'Đang chờ: {summary["queued"]}\n'
+                    f'Wait avg/p95/max: {summary["avg_wait"]:.2f}/{summary["p95_wait"]:.2f}/{summary["max_wait"]:.2f}s'
+                ),
                 inline=True
             )
-        
         await ctx.send(embed=embed)
     
     @commands.hybrid_command(name='leave', description='Rời voice channel', aliases=['disconnect', 'dc'])